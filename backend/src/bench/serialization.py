@@ -0,0 +1,82 @@
+"""
+Сравнение сериализации ответа /news/all: старый путь (jsonable_encoder + JSONResponse)
+против нового (типизированная NewsListResponse + ORJSONResponse), плюс gzip/br поверх.
+
+    cd backend/src && python -m bench.serialization --items 20 --articles 11 --rounds 200
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime, timedelta, timezone
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from schemes.news import NewsListResponse
+
+
+def make_page(items: int, articles: int) -> dict:
+    now = datetime.now(timezone.utc)
+
+    def article(i: int) -> dict:
+        return {
+            "id": i,
+            "source_id": i % 40,
+            "source_domain": f"source-{i % 40}.example.org",
+            "url": f"https://source-{i % 40}.example.org/news/{i}",
+            "title": f"Заголовок новости номер {i} о важном событии",
+            "summary": ("Краткое содержание статьи, достаточно длинное. " * 25)[:1000],
+            "published_at": (now - timedelta(minutes=i)).isoformat(),
+            "image": f"https://cdn.example.org/img/{i}.jpg",
+        }
+
+    return {
+        "items": [
+            {
+                "cluster_id": c,
+                "article": article(c * articles),
+                "other_articles": [article(c * articles + j) for j in range(1, articles)],
+                "bookmarked": False,
+                "read": c % 3 == 0,
+            }
+            for c in range(items)
+        ],
+        "next_cursor": "1760000000000000:42",
+    }
+
+
+def old_path(page: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def new_path(page: dict) -> bytes:
+    return ORJSONResponse(NewsListResponse.model_validate(page).model_dump(mode="json")).body
+
+
+def run(name: str, fn, page: dict, rounds: int) -> None:
+    body = fn(page)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn(page)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<12} {len(body):>9} B  {elapsed / rounds * 1e3:8.3f} ms/page  "
+          f"{len(body) * rounds / elapsed / 2 ** 20:8.1f} MiB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--articles", type=int, default=11)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    page = make_page(args.items, args.articles)
+    run("old", old_path, page, args.rounds)
+    run("new", new_path, page, args.rounds)
+    run("new+gzip", lambda p: gzip.compress(new_path(p), compresslevel=9), page, args.rounds)
+    run("new+br", lambda p: brotli.compress(new_path(p), quality=4), page, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
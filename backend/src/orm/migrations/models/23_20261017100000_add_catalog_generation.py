@@ -0,0 +1,43 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- поколение каталога (source, topic): ETag для /source/all и /news/topics/all
+CREATE SEQUENCE IF NOT EXISTS catalog_generation_seq;
+
+CREATE OR REPLACE FUNCTION bump_catalog_generation()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM nextval('catalog_generation_seq');
+  RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER source_catalog_insert_delete
+AFTER INSERT OR DELETE ON source
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_generation();
+
+-- парсер трогает last_updated_at на каждом опросе — это каталог не меняет
+CREATE TRIGGER source_catalog_update
+AFTER UPDATE ON source
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      OR OLD.kind IS DISTINCT FROM NEW.kind
+      OR OLD.domain IS DISTINCT FROM NEW.domain)
+EXECUTE FUNCTION bump_catalog_generation();
+
+CREATE TRIGGER topic_catalog_change
+AFTER INSERT OR UPDATE OR DELETE ON topic
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_generation();"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP TRIGGER IF EXISTS topic_catalog_change ON topic;
+DROP TRIGGER IF EXISTS source_catalog_update ON source;
+DROP TRIGGER IF EXISTS source_catalog_insert_delete ON source;
+DROP FUNCTION IF EXISTS bump_catalog_generation;
+DROP SEQUENCE IF EXISTS catalog_generation_seq;"""
@@ -0,0 +1,60 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+END
+$$;"""
@@ -0,0 +1,80 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+ALTER TABLE "cluster_source" ADD "first_published_at" TIMESTAMPTZ;
+UPDATE cluster_source cs
+SET first_published_at = agg.first_pub
+FROM (
+    SELECT cluster_id, source_id, MIN(published_at) AS first_pub
+    FROM article
+    GROUP BY cluster_id, source_id
+) agg
+WHERE agg.cluster_id = cs.cluster_id AND agg.source_id = cs.source_id;
+UPDATE cluster_source SET first_published_at = last_published_at WHERE first_published_at IS NULL;
+ALTER TABLE "cluster_source" ALTER COLUMN "first_published_at" SET NOT NULL;
+
+-- пересчёт одной строки индекса (кластер, источник) по article
+CREATE OR REPLACE FUNCTION refresh_cluster_source(p_cluster_id integer, p_source_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_first_pub timestamptz;
+  v_last_pub  timestamptz;
+  v_count     integer;
+BEGIN
+  SELECT MIN(published_at), MAX(published_at), COUNT(*)
+  INTO v_first_pub, v_last_pub, v_count
+  FROM article
+  WHERE cluster_id = p_cluster_id AND source_id = p_source_id;
+
+  IF v_count = 0 THEN
+    DELETE FROM cluster_source
+    WHERE cluster_id = p_cluster_id AND source_id = p_source_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO cluster_source (cluster_id, source_id, first_published_at, last_published_at, article_count)
+  VALUES (p_cluster_id, p_source_id, v_first_pub, v_last_pub, v_count)
+  ON CONFLICT (cluster_id, source_id) DO UPDATE
+    SET first_published_at = EXCLUDED.first_published_at,
+        last_published_at  = EXCLUDED.last_published_at,
+        article_count     = EXCLUDED.article_count;
+END
+$$;
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- пересчёт одной строки индекса (кластер, источник) по article
+CREATE OR REPLACE FUNCTION refresh_cluster_source(p_cluster_id integer, p_source_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_last_pub timestamptz;
+  v_count    integer;
+BEGIN
+  SELECT MAX(published_at), COUNT(*)
+  INTO v_last_pub, v_count
+  FROM article
+  WHERE cluster_id = p_cluster_id AND source_id = p_source_id;
+
+  IF v_count = 0 THEN
+    DELETE FROM cluster_source
+    WHERE cluster_id = p_cluster_id AND source_id = p_source_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO cluster_source (cluster_id, source_id, last_published_at, article_count)
+  VALUES (p_cluster_id, p_source_id, v_last_pub, v_count)
+  ON CONFLICT (cluster_id, source_id) DO UPDATE
+    SET last_published_at = EXCLUDED.last_published_at,
+        article_count     = EXCLUDED.article_count;
+END
+$$;
+
+ALTER TABLE "cluster_source" DROP COLUMN "first_published_at";"""
@@ -0,0 +1,147 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- склейка tsvector'ов (||) как агрегат
+CREATE OR REPLACE AGGREGATE tsvector_agg(tsvector) (
+    SFUNC = tsvector_concat,
+    STYPE = tsvector,
+    INITCOND = ''
+);
+
+-- один поисковый документ на кластер: все его статьи в одном векторе
+CREATE TABLE IF NOT EXISTS "cluster_search" (
+    "cluster_id" INT NOT NULL PRIMARY KEY REFERENCES "cluster" ("id") ON DELETE CASCADE,
+    "document" TSVECTOR NOT NULL,
+    "updated_at" TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_document" ON "cluster_search" USING GIN ("document");
+
+INSERT INTO cluster_search (cluster_id, document)
+SELECT cluster_id, tsvector_agg(search_tsv ORDER BY published_at, id)
+FROM article
+GROUP BY cluster_id
+ON CONFLICT (cluster_id) DO NOTHING;
+
+-- полная пересборка документа кластера (апдейт статьи, уход статьи в другой кластер)
+CREATE OR REPLACE FUNCTION refresh_cluster_search(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_doc tsvector;
+BEGIN
+  SELECT tsvector_agg(search_tsv ORDER BY published_at, id)
+  INTO v_doc
+  FROM article
+  WHERE cluster_id = p_cluster_id;
+
+  IF v_doc IS NULL THEN
+    DELETE FROM cluster_search WHERE cluster_id = p_cluster_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO cluster_search (cluster_id, document, updated_at)
+  VALUES (p_cluster_id, v_doc, now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET document   = EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+
+-- статья присоединилась к кластеру: дописываем только её вектор
+CREATE OR REPLACE FUNCTION append_cluster_search(p_cluster_id integer, p_article_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_tsv tsvector;
+BEGIN
+  SELECT search_tsv INTO v_tsv FROM article WHERE id = p_article_id;
+
+  INSERT INTO cluster_search (cluster_id, document, updated_at)
+  VALUES (p_cluster_id, COALESCE(v_tsv, ''), now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET document   = cluster_search.document || EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;
+
+DROP FUNCTION IF EXISTS append_cluster_search(integer, integer);
+DROP FUNCTION IF EXISTS refresh_cluster_search(integer);
+DROP TABLE IF EXISTS "cluster_search";
+DROP AGGREGATE IF EXISTS tsvector_agg(tsvector);"""
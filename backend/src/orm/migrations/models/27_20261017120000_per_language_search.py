@@ -0,0 +1,189 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- конфигурация полнотекстового поиска по языку (см. utils.enums.Language), иначе simple
+CREATE OR REPLACE FUNCTION search_config(p_language text)
+RETURNS regconfig
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_language IN ('russian', 'english', 'german', 'spanish') THEN p_language::regconfig
+    ELSE 'simple'::regconfig
+  END
+$$;
+
+-- search_tsv больше не сгенерированная колонка: язык берётся из кластера статьи
+DROP INDEX IF EXISTS article_search_tsv_idx;
+ALTER TABLE article DROP COLUMN IF EXISTS search_tsv;
+ALTER TABLE article ADD COLUMN search_tsv tsvector;
+
+CREATE OR REPLACE FUNCTION article_search_tsv_update()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.search_tsv := to_tsvector(
+    search_config((SELECT language FROM cluster WHERE id = NEW.cluster_id)),
+    coalesce(NEW.title,'') || ' ' || coalesce(NEW.summary,'')
+  );
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS article_search_tsv ON article;
+CREATE TRIGGER article_search_tsv
+BEFORE INSERT OR UPDATE OF title, summary, cluster_id ON article
+FOR EACH ROW EXECUTE FUNCTION article_search_tsv_update();
+
+UPDATE article a
+SET search_tsv = to_tsvector(
+    search_config(c.language),
+    coalesce(a.title,'') || ' ' || coalesce(a.summary,'')
+)
+FROM cluster c
+WHERE c.id = a.cluster_id;
+
+CREATE INDEX IF NOT EXISTS article_search_tsv_idx ON article USING GIN (search_tsv);
+
+-- документы кластеров: язык + отдельный частичный индекс на каждый язык
+ALTER TABLE "cluster_search" ADD "language" TEXT NOT NULL DEFAULT 'simple';
+DROP INDEX IF EXISTS "idx_cluster_search_document";
+TRUNCATE cluster_search;
+INSERT INTO cluster_search (cluster_id, language, document)
+SELECT a.cluster_id, search_config(c.language)::text, tsvector_agg(a.search_tsv ORDER BY a.published_at, a.id)
+FROM article a
+JOIN cluster c ON c.id = a.cluster_id
+GROUP BY a.cluster_id, c.language;
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_russian" ON "cluster_search" USING GIN ("document") WHERE language = 'russian';
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_english" ON "cluster_search" USING GIN ("document") WHERE language = 'english';
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_german" ON "cluster_search" USING GIN ("document") WHERE language = 'german';
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_spanish" ON "cluster_search" USING GIN ("document") WHERE language = 'spanish';
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_simple" ON "cluster_search" USING GIN ("document") WHERE language = 'simple';
+
+-- полная пересборка документа кластера (апдейт статьи, уход статьи в другой кластер)
+CREATE OR REPLACE FUNCTION refresh_cluster_search(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_doc  tsvector;
+  v_lang text;
+BEGIN
+  SELECT search_config(language)::text INTO v_lang FROM cluster WHERE id = p_cluster_id;
+
+  SELECT tsvector_agg(search_tsv ORDER BY published_at, id)
+  INTO v_doc
+  FROM article
+  WHERE cluster_id = p_cluster_id;
+
+  IF v_doc IS NULL THEN
+    DELETE FROM cluster_search WHERE cluster_id = p_cluster_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO cluster_search (cluster_id, language, document, updated_at)
+  VALUES (p_cluster_id, COALESCE(v_lang, 'simple'), v_doc, now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET language   = EXCLUDED.language,
+        document   = EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+
+-- статья присоединилась к кластеру: дописываем только её вектор
+CREATE OR REPLACE FUNCTION append_cluster_search(p_cluster_id integer, p_article_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_tsv  tsvector;
+  v_lang text;
+BEGIN
+  SELECT search_tsv INTO v_tsv FROM article WHERE id = p_article_id;
+  SELECT search_config(language)::text INTO v_lang FROM cluster WHERE id = p_cluster_id;
+
+  INSERT INTO cluster_search (cluster_id, language, document, updated_at)
+  VALUES (p_cluster_id, COALESCE(v_lang, 'simple'), COALESCE(v_tsv, ''), now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET document   = cluster_search.document || EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP INDEX IF EXISTS "idx_cluster_search_russian";
+DROP INDEX IF EXISTS "idx_cluster_search_english";
+DROP INDEX IF EXISTS "idx_cluster_search_german";
+DROP INDEX IF EXISTS "idx_cluster_search_spanish";
+DROP INDEX IF EXISTS "idx_cluster_search_simple";
+ALTER TABLE "cluster_search" DROP COLUMN "language";
+CREATE INDEX IF NOT EXISTS "idx_cluster_search_document" ON "cluster_search" USING GIN ("document");
+
+DROP TRIGGER IF EXISTS article_search_tsv ON article;
+DROP FUNCTION IF EXISTS article_search_tsv_update();
+DROP INDEX IF EXISTS article_search_tsv_idx;
+ALTER TABLE article DROP COLUMN IF EXISTS search_tsv;
+ALTER TABLE article
+ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('russian', coalesce(title,'') || ' ' || coalesce(summary,''))
+    ) STORED;
+CREATE INDEX IF NOT EXISTS article_search_tsv_idx ON article USING GIN (search_tsv);
+
+TRUNCATE cluster_search;
+INSERT INTO cluster_search (cluster_id, document)
+SELECT cluster_id, tsvector_agg(search_tsv ORDER BY published_at, id)
+FROM article
+GROUP BY cluster_id;
+
+-- полная пересборка документа кластера (апдейт статьи, уход статьи в другой кластер)
+CREATE OR REPLACE FUNCTION refresh_cluster_search(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_doc tsvector;
+BEGIN
+  SELECT tsvector_agg(search_tsv ORDER BY published_at, id)
+  INTO v_doc
+  FROM article
+  WHERE cluster_id = p_cluster_id;
+
+  IF v_doc IS NULL THEN
+    DELETE FROM cluster_search WHERE cluster_id = p_cluster_id;
+    RETURN;
+  END IF;
+
+  INSERT INTO cluster_search (cluster_id, document, updated_at)
+  VALUES (p_cluster_id, v_doc, now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET document   = EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+
+-- статья присоединилась к кластеру: дописываем только её вектор
+CREATE OR REPLACE FUNCTION append_cluster_search(p_cluster_id integer, p_article_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_tsv tsvector;
+BEGIN
+  SELECT search_tsv INTO v_tsv FROM article WHERE id = p_article_id;
+
+  INSERT INTO cluster_search (cluster_id, document, updated_at)
+  VALUES (p_cluster_id, COALESCE(v_tsv, ''), now())
+  ON CONFLICT (cluster_id) DO UPDATE
+    SET document   = cluster_search.document || EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at;
+END
+$$;
+
+DROP FUNCTION IF EXISTS search_config(text);"""
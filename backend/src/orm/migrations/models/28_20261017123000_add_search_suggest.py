@@ -0,0 +1,66 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- подсказки поиска: частые слова заголовков и заголовки кластеров за последние N дней
+CREATE TABLE IF NOT EXISTS "search_suggest" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "kind" VARCHAR(8) NOT NULL,
+    "language" TEXT NOT NULL,
+    "prefix_key" TEXT COLLATE "C" NOT NULL,
+    "text" TEXT NOT NULL,
+    "score" REAL NOT NULL,
+    "cluster_id" INT REFERENCES "cluster" ("id") ON DELETE CASCADE
+);
+-- префикс — диапазон [prefix, prefix || U+10FFFF) по байтовому порядку
+CREATE INDEX IF NOT EXISTS "idx_search_suggest_prefix" ON "search_suggest" ("kind", "prefix_key", "language");
+
+-- полная пересборка; параллельный вызов из другого воркера просто пропускается
+CREATE OR REPLACE FUNCTION refresh_search_suggest(p_days integer, p_min_freq integer, p_max_titles integer)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('refresh_search_suggest')) THEN
+    RETURN false;
+  END IF;
+
+  DELETE FROM search_suggest;
+
+  INSERT INTO search_suggest (kind, language, prefix_key, text, score)
+  SELECT 'term', w.language, w.word, w.word, COUNT(DISTINCT w.cluster_id)
+  FROM (
+    SELECT search_config(c.language)::text AS language, a.cluster_id,
+           regexp_split_to_table(lower(a.title), '[^[:alnum:]]+') AS word
+    FROM article a
+    JOIN cluster c ON c.id = a.cluster_id
+    WHERE a.published_at >= now() - make_interval(days => p_days)
+  ) w
+  WHERE char_length(w.word) >= 3
+  GROUP BY w.language, w.word
+  HAVING COUNT(DISTINCT w.cluster_id) >= p_min_freq;
+
+  INSERT INTO search_suggest (kind, language, prefix_key, text, score, cluster_id)
+  SELECT 'title', t.language, lower(t.title), t.title, t.articles, t.cluster_id
+  FROM (
+    SELECT DISTINCT ON (a.cluster_id)
+           a.cluster_id, search_config(c.language)::text AS language, a.title,
+           COUNT(*) OVER (PARTITION BY a.cluster_id) AS articles
+    FROM article a
+    JOIN cluster c ON c.id = a.cluster_id
+    WHERE a.published_at >= now() - make_interval(days => p_days)
+    ORDER BY a.cluster_id, a.published_at, a.id
+  ) t
+  ORDER BY t.articles DESC, t.cluster_id DESC
+  LIMIT p_max_titles;
+
+  RETURN true;
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP FUNCTION IF EXISTS refresh_search_suggest(integer, integer, integer);
+DROP TABLE IF EXISTS "search_suggest";"""
@@ -0,0 +1,161 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+ALTER TABLE "cluster" ADD "article_count" INT NOT NULL DEFAULT 0;
+ALTER TABLE "cluster" ADD "source_count" INT NOT NULL DEFAULT 0;
+ALTER TABLE "cluster" ADD "last_published_at" TIMESTAMPTZ;
+ALTER TABLE "cluster" ADD "primary_article_id" INT REFERENCES "article" ("id") ON DELETE SET NULL;
+
+-- пересчёт агрегатов одного кластера по cluster_source; primary — самая свежая статья
+CREATE OR REPLACE FUNCTION refresh_cluster_aggregates(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE cluster c
+  SET article_count      = agg.articles,
+      source_count       = agg.sources,
+      last_published_at  = agg.last_pub,
+      primary_article_id = (
+        SELECT a.id FROM article a
+        WHERE a.cluster_id = p_cluster_id
+        ORDER BY a.published_at DESC, a.id DESC
+        LIMIT 1
+      )
+  FROM (
+    SELECT COALESCE(SUM(article_count), 0) AS articles,
+           COUNT(*) AS sources,
+           MAX(last_published_at) AS last_pub
+    FROM cluster_source
+    WHERE cluster_id = p_cluster_id
+  ) agg
+  WHERE c.id = p_cluster_id;
+END
+$$;
+
+UPDATE cluster c
+SET article_count     = agg.articles,
+    source_count      = agg.sources,
+    last_published_at = agg.last_pub
+FROM (
+  SELECT cluster_id, SUM(article_count) AS articles, COUNT(*) AS sources, MAX(last_published_at) AS last_pub
+  FROM cluster_source
+  GROUP BY cluster_id
+) agg
+WHERE agg.cluster_id = c.id;
+
+UPDATE cluster c
+SET primary_article_id = p.id
+FROM (
+  SELECT DISTINCT ON (cluster_id) cluster_id, id
+  FROM article
+  ORDER BY cluster_id, published_at DESC, id DESC
+) p
+WHERE p.cluster_id = c.id;
+
+CREATE INDEX IF NOT EXISTS "idx_cluster_weight_feed" ON "cluster" ("weight", "last_published_at", "id");
+
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- затронутые кластеры блокируются до пересчёта: параллельные апдейты
+  -- одного кластера идут по очереди и видят статьи друг друга
+  PERFORM 1 FROM cluster
+  WHERE id IN (p_cluster_id, p_prev_cluster_id)
+  ORDER BY id
+  FOR UPDATE;
+
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты кластера (после cluster_source — считаются по нему)
+  PERFORM refresh_cluster_aggregates(p_cluster_id);
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_aggregates(p_prev_cluster_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;
+
+DROP FUNCTION IF EXISTS refresh_cluster_aggregates(integer);
+DROP INDEX IF EXISTS "idx_cluster_weight_feed";
+ALTER TABLE "cluster" DROP COLUMN "primary_article_id";
+ALTER TABLE "cluster" DROP COLUMN "last_published_at";
+ALTER TABLE "cluster" DROP COLUMN "source_count";
+ALTER TABLE "cluster" DROP COLUMN "article_count";"""
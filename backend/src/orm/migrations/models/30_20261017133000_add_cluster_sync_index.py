@@ -0,0 +1,36 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- last_updated_at двигается при любом изменении, видимом в ленте: новые статьи
+-- (агрегаты из on_article_upserted) и вес из телеметрии. clock_timestamp(), а не now(),
+-- чтобы отметка была ближе к моменту коммита.
+CREATE OR REPLACE FUNCTION touch_cluster_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF (NEW.weight, NEW.article_count, NEW.source_count, NEW.last_published_at, NEW.primary_article_id)
+     IS DISTINCT FROM
+     (OLD.weight, OLD.article_count, OLD.source_count, OLD.last_published_at, OLD.primary_article_id) THEN
+    NEW.last_updated_at := clock_timestamp();
+  END IF;
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS cluster_touch_updated_at ON cluster;
+CREATE TRIGGER cluster_touch_updated_at
+BEFORE UPDATE OF weight, article_count, source_count, last_published_at, primary_article_id ON cluster
+FOR EACH ROW EXECUTE FUNCTION touch_cluster_updated_at();
+
+-- токен синхронизации (last_updated_at, id): стоимость /news/changes растёт с дельтой
+CREATE INDEX IF NOT EXISTS "idx_cluster_sync" ON "cluster" ("last_updated_at", "id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP INDEX IF EXISTS "idx_cluster_sync";
+DROP TRIGGER IF EXISTS cluster_touch_updated_at ON cluster;
+DROP FUNCTION IF EXISTS touch_cluster_updated_at();"""
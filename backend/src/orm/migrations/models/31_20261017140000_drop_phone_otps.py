@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- коды входа, кулдаун и попытки живут в Redis (utils/otp.py)
+DROP TABLE IF EXISTS "phone_otps";
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+CREATE TABLE IF NOT EXISTS "phone_otps" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "phone" VARCHAR(32) NOT NULL,
+    "code_hash" VARCHAR(128) NOT NULL,
+    "expires_at" TIMESTAMPTZ NOT NULL,
+    "attempts" INT NOT NULL  DEFAULT 0,
+    "last_sent_at" TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS "idx_phone_otps_phone_ef3555" ON "phone_otps" ("phone");
+"""
@@ -0,0 +1,31 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- на источники по умолчанию подписаны неявно: строка нужна только при своих настройках
+-- или как исключение (excluded — пользователь отписался)
+ALTER TABLE "usersource" ADD "excluded" BOOL NOT NULL DEFAULT False;
+
+-- материализованные при регистрации строки с настройками по умолчанию больше не нужны
+DELETE FROM "usersource" us
+USING "source" s
+WHERE s.id = us.source_id
+  AND s.is_default
+  AND us.rank = 0
+  AND us.poll_interval_sec = 900;
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+INSERT INTO "usersource" (user_id, source_id, poll_interval_sec, rank, created_at)
+SELECT u.id, s.id, 900, 0, CURRENT_TIMESTAMP
+FROM "user" u
+CROSS JOIN "source" s
+WHERE s.is_default
+ON CONFLICT (user_id, source_id) DO NOTHING;
+
+DELETE FROM "usersource" WHERE excluded;
+ALTER TABLE "usersource" DROP COLUMN "excluded";
+"""
@@ -0,0 +1,151 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- очередь пересчёта агрегатов: только вставки, без FK и уникальных ключей,
+-- чтобы транзакции парсера не ждали друг друга и строк cluster
+CREATE TABLE IF NOT EXISTS "cluster_refresh_queue" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "cluster_id" INT NOT NULL,
+    "queued_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- разбор очереди бэкендом (utils/cluster_refresh.py): видны только закоммиченные записи,
+-- кластеры пересчитываются по возрастанию id — тот же порядок блокировок, что у весов
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_cluster_id integer;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_cluster_id IN
+    WITH taken AS (
+      DELETE FROM cluster_refresh_queue
+      WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+      RETURNING cluster_id
+    )
+    SELECT DISTINCT cluster_id FROM taken ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_cluster_id);
+    v_count := v_count + 1;
+  END LOOP;
+  RETURN v_count;
+END
+$$;
+
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты кластера пересчитываются после коммита (drain_cluster_refresh_queue):
+  -- строки cluster не блокируются в транзакции пачки парсера
+  INSERT INTO cluster_refresh_queue (cluster_id) VALUES (p_cluster_id);
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    INSERT INTO cluster_refresh_queue (cluster_id) VALUES (p_prev_cluster_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- затронутые кластеры блокируются до пересчёта: параллельные апдейты
+  -- одного кластера идут по очереди и видят статьи друг друга
+  PERFORM 1 FROM cluster
+  WHERE id IN (p_cluster_id, p_prev_cluster_id)
+  ORDER BY id
+  FOR UPDATE;
+
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты кластера (после cluster_source — считаются по нему)
+  PERFORM refresh_cluster_aggregates(p_cluster_id);
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_aggregates(p_prev_cluster_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;
+
+-- недоразобранная очередь: пересчитываем сразу
+SELECT refresh_cluster_aggregates(cluster_id)
+FROM (SELECT DISTINCT cluster_id FROM cluster_refresh_queue ORDER BY cluster_id) q;
+
+DROP FUNCTION IF EXISTS drain_cluster_refresh_queue(integer);
+DROP TABLE IF EXISTS "cluster_refresh_queue";"""
@@ -0,0 +1,105 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- primary_article_id не читает ни лента, ни вес: перестаём поддерживать
+CREATE OR REPLACE FUNCTION refresh_cluster_aggregates(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE cluster c
+  SET article_count     = agg.articles,
+      source_count      = agg.sources,
+      last_published_at = agg.last_pub
+  FROM (
+    SELECT COALESCE(SUM(article_count), 0) AS articles,
+           COUNT(*) AS sources,
+           MAX(last_published_at) AS last_pub
+    FROM cluster_source
+    WHERE cluster_id = p_cluster_id
+  ) agg
+  WHERE c.id = p_cluster_id;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION touch_cluster_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF (NEW.weight, NEW.article_count, NEW.source_count, NEW.last_published_at)
+     IS DISTINCT FROM
+     (OLD.weight, OLD.article_count, OLD.source_count, OLD.last_published_at) THEN
+    NEW.last_updated_at := clock_timestamp();
+  END IF;
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS cluster_touch_updated_at ON cluster;
+CREATE TRIGGER cluster_touch_updated_at
+BEFORE UPDATE OF weight, article_count, source_count, last_published_at ON cluster
+FOR EACH ROW EXECUTE FUNCTION touch_cluster_updated_at();
+
+ALTER TABLE "cluster" DROP COLUMN IF EXISTS "primary_article_id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+ALTER TABLE "cluster" ADD "primary_article_id" INT REFERENCES "article" ("id") ON DELETE SET NULL;
+
+UPDATE cluster c
+SET primary_article_id = p.id
+FROM (
+  SELECT DISTINCT ON (cluster_id) cluster_id, id
+  FROM article
+  ORDER BY cluster_id, published_at DESC, id DESC
+) p
+WHERE p.cluster_id = c.id;
+
+CREATE OR REPLACE FUNCTION refresh_cluster_aggregates(p_cluster_id integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE cluster c
+  SET article_count      = agg.articles,
+      source_count       = agg.sources,
+      last_published_at  = agg.last_pub,
+      primary_article_id = (
+        SELECT a.id FROM article a
+        WHERE a.cluster_id = p_cluster_id
+        ORDER BY a.published_at DESC, a.id DESC
+        LIMIT 1
+      )
+  FROM (
+    SELECT COALESCE(SUM(article_count), 0) AS articles,
+           COUNT(*) AS sources,
+           MAX(last_published_at) AS last_pub
+    FROM cluster_source
+    WHERE cluster_id = p_cluster_id
+  ) agg
+  WHERE c.id = p_cluster_id;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION touch_cluster_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF (NEW.weight, NEW.article_count, NEW.source_count, NEW.last_published_at, NEW.primary_article_id)
+     IS DISTINCT FROM
+     (OLD.weight, OLD.article_count, OLD.source_count, OLD.last_published_at, OLD.primary_article_id) THEN
+    NEW.last_updated_at := clock_timestamp();
+  END IF;
+  RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS cluster_touch_updated_at ON cluster;
+CREATE TRIGGER cluster_touch_updated_at
+BEFORE UPDATE OF weight, article_count, source_count, last_published_at, primary_article_id ON cluster
+FOR EACH ROW EXECUTE FUNCTION touch_cluster_updated_at();"""
@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- is_default меняет connected/user_source_id в каталоге у всех пользователей
+DROP TRIGGER IF EXISTS source_catalog_update ON source;
+CREATE TRIGGER source_catalog_update
+AFTER UPDATE ON source
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      OR OLD.kind IS DISTINCT FROM NEW.kind
+      OR OLD.domain IS DISTINCT FROM NEW.domain
+      OR OLD.is_default IS DISTINCT FROM NEW.is_default)
+EXECUTE FUNCTION bump_catalog_generation();"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP TRIGGER IF EXISTS source_catalog_update ON source;
+CREATE TRIGGER source_catalog_update
+AFTER UPDATE ON source
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status
+      OR OLD.kind IS DISTINCT FROM NEW.kind
+      OR OLD.domain IS DISTINCT FROM NEW.domain)
+EXECUTE FUNCTION bump_catalog_generation();"""
@@ -0,0 +1,201 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- поиск обслуживается той же очередью, что и агрегаты:
+-- article_id — дописать статью в документ, rebuild_search — пересобрать документ
+ALTER TABLE "cluster_refresh_queue" ADD "article_id" INT;
+ALTER TABLE "cluster_refresh_queue" ADD "rebuild_search" BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- пересборка только при реальной смене текста (search_tsv учитывает и язык кластера);
+-- перенос в другой кластер ставит работу сам on_article_upserted
+CREATE OR REPLACE FUNCTION queue_cluster_search_rebuild()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO cluster_refresh_queue (cluster_id, rebuild_search) VALUES (NEW.cluster_id, TRUE);
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS article_search_changed ON article;
+CREATE TRIGGER article_search_changed
+AFTER UPDATE OF title, summary ON article
+FOR EACH ROW
+WHEN (OLD.cluster_id = NEW.cluster_id AND OLD.search_tsv IS DISTINCT FROM NEW.search_tsv)
+EXECUTE FUNCTION queue_cluster_search_rebuild();
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_row   record;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_row IN
+    WITH taken AS (
+      DELETE FROM cluster_refresh_queue
+      WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+      RETURNING cluster_id, article_id, rebuild_search
+    )
+    SELECT cluster_id,
+           bool_or(rebuild_search) AS rebuild,
+           array_agg(DISTINCT article_id) FILTER (WHERE article_id IS NOT NULL) AS appended
+    FROM taken
+    GROUP BY cluster_id
+    ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_row.cluster_id);
+
+    IF v_row.rebuild THEN
+      PERFORM refresh_cluster_search(v_row.cluster_id);
+    ELSIF v_row.appended IS NOT NULL THEN
+      -- статья могла уже уйти дальше: тогда её кластер пересоберётся по своей записи
+      PERFORM append_cluster_search(v_row.cluster_id, a.id)
+      FROM article a
+      WHERE a.id = ANY(v_row.appended) AND a.cluster_id = v_row.cluster_id;
+    END IF;
+
+    v_count := v_count + 1;
+  END LOOP;
+  RETURN v_count;
+END
+$$;
+
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты и поисковый документ кластера пересчитываются после коммита
+  -- (drain_cluster_refresh_queue): ни cluster, ни cluster_search не блокируются
+  -- в транзакции пачки парсера. Статья, пришедшая в кластер, дописывается в документ;
+  -- кластер, который она покинула, пересобирается. Правка текста на месте
+  -- ставит пересборку сама (article_search_changed).
+  INSERT INTO cluster_refresh_queue (cluster_id, article_id)
+  VALUES (p_cluster_id, CASE WHEN p_prev_cluster_id IS DISTINCT FROM p_cluster_id THEN p_article_id END);
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    INSERT INTO cluster_refresh_queue (cluster_id, rebuild_search) VALUES (p_prev_cluster_id, TRUE);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты кластера пересчитываются после коммита (drain_cluster_refresh_queue):
+  -- строки cluster не блокируются в транзакции пачки парсера
+  INSERT INTO cluster_refresh_queue (cluster_id) VALUES (p_cluster_id);
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    INSERT INTO cluster_refresh_queue (cluster_id) VALUES (p_prev_cluster_id);
+  END IF;
+
+  -- поколение ленты источника: инвалидирует кэш страниц в Redis
+  UPDATE source SET feed_generation = feed_generation + 1 WHERE id = p_source_id;
+
+  -- поисковый документ кластера: новая статья дописывается, иначе пересборка
+  IF p_prev_cluster_id IS NULL OR p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM append_cluster_search(p_cluster_id, p_article_id);
+  ELSE
+    PERFORM refresh_cluster_search(p_cluster_id);
+  END IF;
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_search(p_prev_cluster_id);
+  END IF;
+
+  -- уведомление бэкенду (доставляется при COMMIT, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', p_cluster_id,
+    'source_id', p_source_id,
+    'created_new', p_created_new
+  )::text);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_cluster_id integer;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_cluster_id IN
+    WITH taken AS (
+      DELETE FROM cluster_refresh_queue
+      WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+      RETURNING cluster_id
+    )
+    SELECT DISTINCT cluster_id FROM taken ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_cluster_id);
+    v_count := v_count + 1;
+  END LOOP;
+  RETURN v_count;
+END
+$$;
+
+-- поисковая работа из очереди: выполняем сразу, агрегаты разберёт старый drain
+SELECT refresh_cluster_search(cluster_id)
+FROM (
+  SELECT DISTINCT cluster_id FROM cluster_refresh_queue
+  WHERE rebuild_search OR article_id IS NOT NULL
+  ORDER BY cluster_id
+) q;
+
+DROP TRIGGER IF EXISTS article_search_changed ON article;
+DROP FUNCTION IF EXISTS queue_cluster_search_rebuild();
+ALTER TABLE "cluster_refresh_queue" DROP COLUMN "rebuild_search";
+ALTER TABLE "cluster_refresh_queue" DROP COLUMN "article_id";"""
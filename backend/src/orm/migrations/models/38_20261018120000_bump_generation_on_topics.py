@@ -0,0 +1,193 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- темы кластера (clustertopic) фильтруют ленту: их смена тоже должна поднять поколения
+ALTER TABLE "cluster_refresh_queue" ADD "topics_changed" BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- changed_rows — переходная таблица триггера (новые или старые строки)
+CREATE OR REPLACE FUNCTION queue_topic_clusters()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO cluster_refresh_queue (cluster_id, topics_changed)
+  SELECT DISTINCT cluster_id, TRUE FROM changed_rows;
+  RETURN NULL;
+END
+$$;
+
+-- по одному разу на оператор; переходные таблицы допускают только одно событие на триггер
+DROP TRIGGER IF EXISTS clustertopic_insert ON clustertopic;
+CREATE TRIGGER clustertopic_insert
+AFTER INSERT ON clustertopic
+REFERENCING NEW TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_topic_clusters();
+
+DROP TRIGGER IF EXISTS clustertopic_delete ON clustertopic;
+CREATE TRIGGER clustertopic_delete
+AFTER DELETE ON clustertopic
+REFERENCING OLD TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_topic_clusters();
+
+DROP TRIGGER IF EXISTS clustertopic_update_new ON clustertopic;
+CREATE TRIGGER clustertopic_update_new
+AFTER UPDATE ON clustertopic
+REFERENCING NEW TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_topic_clusters();
+
+DROP TRIGGER IF EXISTS clustertopic_update_old ON clustertopic;
+CREATE TRIGGER clustertopic_update_old
+AFTER UPDATE ON clustertopic
+REFERENCING OLD TABLE AS changed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_topic_clusters();
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_taken cluster_refresh_queue[];
+  v_row   record;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  WITH taken AS (
+    DELETE FROM cluster_refresh_queue
+    WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+    RETURNING *
+  )
+  SELECT array_agg(ROW(t.*)::cluster_refresh_queue ORDER BY t.id) INTO v_taken FROM taken t;
+  IF v_taken IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_row IN
+    SELECT cluster_id,
+           bool_or(rebuild_search) AS rebuild,
+           array_agg(DISTINCT article_id) FILTER (WHERE article_id IS NOT NULL) AS appended
+    FROM unnest(v_taken)
+    GROUP BY cluster_id
+    ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_row.cluster_id);
+
+    IF v_row.rebuild THEN
+      PERFORM refresh_cluster_search(v_row.cluster_id);
+    ELSIF v_row.appended IS NOT NULL THEN
+      -- статья могла уже уйти дальше: тогда её кластер пересоберётся по своей записи
+      PERFORM append_cluster_search(v_row.cluster_id, a.id)
+      FROM article a
+      WHERE a.id = ANY(v_row.appended) AND a.cluster_id = v_row.cluster_id;
+    END IF;
+
+    v_count := v_count + 1;
+  END LOOP;
+
+  -- агрегаты записаны — теперь поколения лент (один инкремент на источник за проход):
+  -- источники новых статей и все источники кластеров, у которых сменились темы
+  UPDATE source SET feed_generation = feed_generation + 1
+  WHERE id IN (
+    SELECT source_id FROM unnest(v_taken) WHERE source_id IS NOT NULL
+    UNION
+    SELECT cs.source_id
+    FROM cluster_source cs
+    WHERE cs.cluster_id IN (SELECT cluster_id FROM unnest(v_taken) WHERE topics_changed)
+  );
+
+  -- уведомления бэкенду (доставляются при COMMIT разбора, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', q.cluster_id,
+    'source_id', q.source_id,
+    'created_new', q.created_new
+  )::text)
+  FROM unnest(v_taken) q
+  WHERE q.created_new IS NOT NULL;
+
+  RETURN v_count;
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+DROP TRIGGER IF EXISTS clustertopic_update_old ON clustertopic;
+DROP TRIGGER IF EXISTS clustertopic_update_new ON clustertopic;
+DROP TRIGGER IF EXISTS clustertopic_delete ON clustertopic;
+DROP TRIGGER IF EXISTS clustertopic_insert ON clustertopic;
+DROP FUNCTION IF EXISTS queue_topic_clusters();
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_taken cluster_refresh_queue[];
+  v_row   record;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  WITH taken AS (
+    DELETE FROM cluster_refresh_queue
+    WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+    RETURNING *
+  )
+  SELECT array_agg(ROW(t.*)::cluster_refresh_queue ORDER BY t.id) INTO v_taken FROM taken t;
+  IF v_taken IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_row IN
+    SELECT cluster_id,
+           bool_or(rebuild_search) AS rebuild,
+           array_agg(DISTINCT article_id) FILTER (WHERE article_id IS NOT NULL) AS appended
+    FROM unnest(v_taken)
+    GROUP BY cluster_id
+    ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_row.cluster_id);
+
+    IF v_row.rebuild THEN
+      PERFORM refresh_cluster_search(v_row.cluster_id);
+    ELSIF v_row.appended IS NOT NULL THEN
+      -- статья могла уже уйти дальше: тогда её кластер пересоберётся по своей записи
+      PERFORM append_cluster_search(v_row.cluster_id, a.id)
+      FROM article a
+      WHERE a.id = ANY(v_row.appended) AND a.cluster_id = v_row.cluster_id;
+    END IF;
+
+    v_count := v_count + 1;
+  END LOOP;
+
+  -- агрегаты записаны — теперь поколения лент (один инкремент на источник за проход)
+  UPDATE source SET feed_generation = feed_generation + 1
+  WHERE id IN (SELECT DISTINCT source_id FROM unnest(v_taken) WHERE source_id IS NOT NULL);
+
+  -- уведомления бэкенду (доставляются при COMMIT разбора, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', q.cluster_id,
+    'source_id', q.source_id,
+    'created_new', q.created_new
+  )::text)
+  FROM unnest(v_taken) q
+  WHERE q.created_new IS NOT NULL;
+
+  RETURN v_count;
+END
+$$;
+
+UPDATE source SET feed_generation = feed_generation + 1
+WHERE id IN (
+  SELECT cs.source_id
+  FROM cluster_source cs
+  WHERE cs.cluster_id IN (SELECT cluster_id FROM cluster_refresh_queue WHERE topics_changed)
+);
+DELETE FROM cluster_refresh_queue WHERE topics_changed AND source_id IS NULL;
+ALTER TABLE "cluster_refresh_queue" DROP COLUMN "topics_changed";"""
@@ -0,0 +1,231 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- статья ушла из другого кластера: его id едет в уведомлении, чтобы подписчики
+-- (горячее окно ленты) перечитали и его
+ALTER TABLE "cluster_refresh_queue" ADD "prev_cluster_id" INT;
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_taken cluster_refresh_queue[];
+  v_row   record;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  WITH taken AS (
+    DELETE FROM cluster_refresh_queue
+    WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+    RETURNING *
+  )
+  SELECT array_agg(ROW(t.*)::cluster_refresh_queue ORDER BY t.id) INTO v_taken FROM taken t;
+  IF v_taken IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_row IN
+    SELECT cluster_id,
+           bool_or(rebuild_search) AS rebuild,
+           array_agg(DISTINCT article_id) FILTER (WHERE article_id IS NOT NULL) AS appended
+    FROM unnest(v_taken)
+    GROUP BY cluster_id
+    ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_row.cluster_id);
+
+    IF v_row.rebuild THEN
+      PERFORM refresh_cluster_search(v_row.cluster_id);
+    ELSIF v_row.appended IS NOT NULL THEN
+      -- статья могла уже уйти дальше: тогда её кластер пересоберётся по своей записи
+      PERFORM append_cluster_search(v_row.cluster_id, a.id)
+      FROM article a
+      WHERE a.id = ANY(v_row.appended) AND a.cluster_id = v_row.cluster_id;
+    END IF;
+
+    v_count := v_count + 1;
+  END LOOP;
+
+  -- агрегаты записаны — теперь поколения лент (один инкремент на источник за проход):
+  -- источники новых статей и все источники кластеров, у которых сменились темы
+  UPDATE source SET feed_generation = feed_generation + 1
+  WHERE id IN (
+    SELECT source_id FROM unnest(v_taken) WHERE source_id IS NOT NULL
+    UNION
+    SELECT cs.source_id
+    FROM cluster_source cs
+    WHERE cs.cluster_id IN (SELECT cluster_id FROM unnest(v_taken) WHERE topics_changed)
+  );
+
+  -- уведомления бэкенду (доставляются при COMMIT разбора, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', q.cluster_id,
+    'source_id', q.source_id,
+    'created_new', q.created_new,
+    'prev_cluster_id', q.prev_cluster_id
+  )::text)
+  FROM unnest(v_taken) q
+  WHERE q.created_new IS NOT NULL;
+
+  RETURN v_count;
+END
+$$;
+
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты и поисковый документ кластера пересчитываются после коммита
+  -- (drain_cluster_refresh_queue): ни cluster, ни cluster_search не блокируются
+  -- в транзакции пачки парсера. Статья, пришедшая в кластер, дописывается в документ;
+  -- кластер, который она покинула, пересобирается. Правка текста на месте
+  -- ставит пересборку сама (article_search_changed).
+  -- Поколение ленты источника и NOTIFY — тоже из разбора, после агрегатов:
+  -- кэш страниц и клиенты не видят статью раньше, чем её агрегаты.
+  INSERT INTO cluster_refresh_queue (cluster_id, article_id, source_id, created_new, prev_cluster_id)
+  VALUES (
+    p_cluster_id,
+    CASE WHEN p_prev_cluster_id IS DISTINCT FROM p_cluster_id THEN p_article_id END,
+    p_source_id,
+    p_created_new,
+    NULLIF(p_prev_cluster_id, p_cluster_id)
+  );
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    INSERT INTO cluster_refresh_queue (cluster_id, rebuild_search, source_id)
+    VALUES (p_prev_cluster_id, TRUE, p_source_id);
+  END IF;
+END
+$$;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+-- всё, что нужно поддерживать после вставки/апдейта статьи
+CREATE OR REPLACE FUNCTION on_article_upserted(
+    p_article_id      integer,
+    p_source_id       integer,
+    p_cluster_id      integer,
+    p_prev_cluster_id integer,
+    p_created_new     boolean
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_cluster_source(p_cluster_id, p_source_id);
+  -- статья переехала в другой кластер: старая пара тоже меняется
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    PERFORM refresh_cluster_source(p_prev_cluster_id, p_source_id);
+  END IF;
+
+  -- агрегаты и поисковый документ кластера пересчитываются после коммита
+  -- (drain_cluster_refresh_queue): ни cluster, ни cluster_search не блокируются
+  -- в транзакции пачки парсера. Статья, пришедшая в кластер, дописывается в документ;
+  -- кластер, который она покинула, пересобирается. Правка текста на месте
+  -- ставит пересборку сама (article_search_changed).
+  -- Поколение ленты источника и NOTIFY — тоже из разбора, после агрегатов:
+  -- кэш страниц и клиенты не видят статью раньше, чем её агрегаты.
+  INSERT INTO cluster_refresh_queue (cluster_id, article_id, source_id, created_new)
+  VALUES (
+    p_cluster_id,
+    CASE WHEN p_prev_cluster_id IS DISTINCT FROM p_cluster_id THEN p_article_id END,
+    p_source_id,
+    p_created_new
+  );
+  IF p_prev_cluster_id IS NOT NULL AND p_prev_cluster_id <> p_cluster_id THEN
+    INSERT INTO cluster_refresh_queue (cluster_id, rebuild_search, source_id)
+    VALUES (p_prev_cluster_id, TRUE, p_source_id);
+  END IF;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION drain_cluster_refresh_queue(p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_taken cluster_refresh_queue[];
+  v_row   record;
+  v_count integer := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('drain_cluster_refresh_queue')) THEN
+    RETURN 0;
+  END IF;
+
+  WITH taken AS (
+    DELETE FROM cluster_refresh_queue
+    WHERE id IN (SELECT id FROM cluster_refresh_queue ORDER BY id LIMIT p_limit)
+    RETURNING *
+  )
+  SELECT array_agg(ROW(t.*)::cluster_refresh_queue ORDER BY t.id) INTO v_taken FROM taken t;
+  IF v_taken IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  FOR v_row IN
+    SELECT cluster_id,
+           bool_or(rebuild_search) AS rebuild,
+           array_agg(DISTINCT article_id) FILTER (WHERE article_id IS NOT NULL) AS appended
+    FROM unnest(v_taken)
+    GROUP BY cluster_id
+    ORDER BY cluster_id
+  LOOP
+    PERFORM refresh_cluster_aggregates(v_row.cluster_id);
+
+    IF v_row.rebuild THEN
+      PERFORM refresh_cluster_search(v_row.cluster_id);
+    ELSIF v_row.appended IS NOT NULL THEN
+      -- статья могла уже уйти дальше: тогда её кластер пересоберётся по своей записи
+      PERFORM append_cluster_search(v_row.cluster_id, a.id)
+      FROM article a
+      WHERE a.id = ANY(v_row.appended) AND a.cluster_id = v_row.cluster_id;
+    END IF;
+
+    v_count := v_count + 1;
+  END LOOP;
+
+  -- агрегаты записаны — теперь поколения лент (один инкремент на источник за проход):
+  -- источники новых статей и все источники кластеров, у которых сменились темы
+  UPDATE source SET feed_generation = feed_generation + 1
+  WHERE id IN (
+    SELECT source_id FROM unnest(v_taken) WHERE source_id IS NOT NULL
+    UNION
+    SELECT cs.source_id
+    FROM cluster_source cs
+    WHERE cs.cluster_id IN (SELECT cluster_id FROM unnest(v_taken) WHERE topics_changed)
+  );
+
+  -- уведомления бэкенду (доставляются при COMMIT разбора, одинаковые схлопываются)
+  PERFORM pg_notify('article_upserted', json_build_object(
+    'cluster_id', q.cluster_id,
+    'source_id', q.source_id,
+    'created_new', q.created_new
+  )::text)
+  FROM unnest(v_taken) q
+  WHERE q.created_new IS NOT NULL;
+
+  RETURN v_count;
+END
+$$;
+
+ALTER TABLE "cluster_refresh_queue" DROP COLUMN "prev_cluster_id";"""
@@ -1,10 +1,7 @@
-from datetime import datetime, timezone
-
 from tortoise import fields
 from tortoise.indexes import Index
 from tortoise.models import Model
 
-from settings import settings
 from utils.enums import SourceKind, SourceStatus, Language
 
 
@@ -16,39 +13,6 @@ class User(Model):
     avatar = fields.CharField(max_length=512, null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
 
-    async def source_ids(self):
-        return [
-            r.source_id for r in await
-            UserSource.filter(
-                user_id=self.id,
-                source__status=SourceStatus.ACTIVE
-            ).all()
-        ]
-
-
-class PhoneOTP(Model):
-    id = fields.IntField(pk=True)
-    phone = fields.CharField(max_length=32, index=True)
-    code_hash = fields.CharField(max_length=128)
-    expires_at = fields.DatetimeField()
-    attempts = fields.IntField(default=0)
-    last_sent_at: datetime = fields.DatetimeField(null=True)
-
-    @property
-    def is_expired(self) -> bool:
-        return datetime.now(timezone.utc) > self.expires_at
-
-    @property
-    def can_resend(self) -> bool:
-        if not self.last_sent_at:
-            return True
-        delta = (datetime.now(timezone.utc) - self.last_sent_at).total_seconds()
-        return delta >= settings.otp.resend_sec
-
-    class Meta:
-        table = "phone_otps"
-        indexes = (("phone",),)
-
 
 class Source(Model):
     """
@@ -59,6 +23,8 @@ class Source(Model):
     domain = fields.TextField()
     status = fields.CharEnumField(SourceStatus, max_length=16, default=SourceStatus.ERROR)
     is_default = fields.BooleanField(default=False)
+    # растёт после разбора очереди статей источника (drain_cluster_refresh_queue), ключ кэша ленты
+    feed_generation = fields.BigIntField(default=0)
     created_at = fields.DatetimeField(auto_now_add=True)
     last_updated_at = fields.DatetimeField(auto_now=True, null=True)
 
@@ -70,12 +36,15 @@ class UserSource(Model):
     """
     Подключение источника пользователем.
     rank — приоритет этого источника.
+    На источники по умолчанию пользователь подписан без строки (utils/subscriptions.py):
+    строка появляется при изменении настроек, excluded — отписка от такого источника.
     """
     id = fields.IntField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="user_sources", on_delete=fields.CASCADE)
     source = fields.ForeignKeyField("models.Source", related_name="user_sources", on_delete=fields.CASCADE)
     poll_interval_sec = fields.IntField(default=900)
     rank = fields.IntField(default=0)
+    excluded = fields.BooleanField(default=False)
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -93,12 +62,18 @@ class Cluster(Model):
     last_updated_at = fields.DatetimeField(auto_now=True, index=True)
     language = fields.CharEnumField(Language, max_length=8, default=Language.RU)
     weight = fields.IntField(default=0)
+    # агрегаты по статьям — пересчитывает drain_cluster_refresh_queue, лента их не пересчитывает
+    article_count = fields.IntField(default=0)
+    source_count = fields.IntField(default=0)
+    last_published_at = fields.DatetimeField(null=True)
 
     class Meta:
         indexes = [
             Index(fields=("first_published_at",)),
             Index(fields=("last_updated_at",)),
             Index(fields=("weight",)),
+            Index(fields=("weight", "last_published_at", "id"), name="idx_cluster_weight_feed"),
+            Index(fields=("last_updated_at", "id"), name="idx_cluster_sync"),
         ]
 
 
@@ -124,6 +99,28 @@ class Article(Model):
         unique_together = (("source", "url"),)
 
 
+class ClusterSource(Model):
+    """
+    Индекс ленты: одна строка на пару (кластер, источник).
+    Поддерживается в upsert_article_with_cluster, чтобы лента
+    не агрегировала article на каждый запрос.
+    """
+    id = fields.IntField(pk=True)
+    cluster = fields.ForeignKeyField("models.Cluster", related_name="source_index", on_delete=fields.CASCADE)
+    source = fields.ForeignKeyField("models.Source", related_name="cluster_index", on_delete=fields.CASCADE)
+    # окно публикаций источника в кластере: по нему since/until отбирают кластеры
+    first_published_at = fields.DatetimeField()
+    last_published_at = fields.DatetimeField()
+    article_count = fields.IntField(default=0)
+
+    class Meta:
+        table = "cluster_source"
+        indexes = [
+            Index(fields=("source_id", "last_published_at", "cluster_id"), name="idx_cluster_source_feed"),
+        ]
+        unique_together = (("cluster", "source"),)
+
+
 class UserArticleState(Model):
     id = fields.IntField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="article_states", on_delete=fields.CASCADE)
@@ -1,12 +1,14 @@
 import json
 
-from datetime import timedelta, timezone, datetime
+from datetime import timezone, datetime
 from fastapi import APIRouter, HTTPException, Request, Depends
 
-from orm.models import User, PhoneOTP, Source, UserSource
+from orm.models import User
 from schemes.auth import PhoneIn, VerifyIn, RefreshIn, TokenPair
 from settings import settings
 from utils.auth import make_token, gen_code, hash_code, decode_refresh_token
+from utils.otp import hit_windows, issue_code, check_code, client_ip, retry_after, \
+    OTP_MISSING, OTP_EXHAUSTED, OTP_INVALID, ISSUE_COOLDOWN, ISSUE_RATE_LIMITED
 from redis.asyncio import Redis
 
 
@@ -27,63 +29,52 @@ async def send_sms(redis: Redis, payload: dict) -> bool:
 
 
 @router.post("/request")
-async def request_code(body: PhoneIn, r: Redis = Depends(get_redis)):
-    phone, now_utc = body.phone, datetime.now(timezone.utc)
-    otp = await PhoneOTP.get_or_none(phone=phone)
-
-    if otp and not otp.can_resend:
-        raise HTTPException(429, "too many requests, wait before resend")
+async def request_code(body: PhoneIn, request: Request, r: Redis = Depends(get_redis)):
+    phone = body.phone
 
+    # кулдаун и лимиты — до отправки SMS; в окнах учитываются только выданные коды
     code = gen_code(settings.otp.length)
-    code_h = hash_code(code)
-    expires = now_utc + timedelta(minutes=settings.otp.ttl_min)
-
-    if otp:
-        otp.code_hash = code_h
-        otp.expires_at = expires
-        otp.attempts = 0
-        otp.last_sent_at = now_utc
-        await otp.save()
-    else:
-        await PhoneOTP.create(
-            phone=phone,
-            code_hash=code_h,
-            expires_at=expires,
-            attempts=0,
-            last_sent_at=now_utc,
-        )
+    status, wait = await issue_code(
+        r,
+        phone,
+        hash_code(code),
+        limits={
+            f"phone:{phone}": settings.otp.phone_max_requests,
+            f"ip:{client_ip(request)}": settings.otp.ip_max_requests,
+        },
+        window_sec=settings.otp.rate_window_sec,
+    )
+    if status == ISSUE_COOLDOWN:
+        raise HTTPException(429, "too many requests, wait before resend", headers=retry_after(wait))
+    if status == ISSUE_RATE_LIMITED:
+        raise HTTPException(429, "too many requests", headers=retry_after(wait))
+
     response = await send_sms(r, payload={"phone_number": phone, "verification_code": code})
     return {"ok": response}
 
 
 @router.post("/verify")
-async def verify_code(body: VerifyIn) -> TokenPair:
+async def verify_code(body: VerifyIn, request: Request, r: Redis = Depends(get_redis)) -> TokenPair:
     phone, code, now_utc = body.phone, body.code, datetime.now(timezone.utc)
-    otp = await PhoneOTP.get_or_none(phone=phone)
-    if not otp:
-        raise HTTPException(400, "request code first")
 
-    if otp.is_expired:
-        await otp.delete()
-        raise HTTPException(400, "code expired")
+    if wait := await hit_windows(
+        r, {f"verify:{client_ip(request)}": settings.otp.ip_max_verifies},
+        window_sec=settings.otp.rate_window_sec,
+    ):
+        raise HTTPException(429, "too many requests", headers=retry_after(wait))
 
-    if otp.attempts >= settings.otp.max_attempts:
-        await otp.delete()
+    status = await check_code(r, phone, hash_code(code))
+    if status == OTP_MISSING:
+        raise HTTPException(400, "request code first")
+    if status == OTP_EXHAUSTED:
         raise HTTPException(429, "too many attempts")
-
-    if otp.code_hash != hash_code(code):
-        otp.attempts += 1
-        await otp.save()
+    if status == OTP_INVALID:
         raise HTTPException(400, "invalid code")
 
-    await otp.delete()
-
+    # источники по умолчанию подключены неявно (utils/subscriptions.py) — строк не создаём
     user = await User.get_or_none(phone=phone)
     if not user:
         user = await User.create(phone=phone, phone_verified_at=now_utc)
-        for source in await Source.filter(is_default=True):
-            await UserSource.create(user=user, source=source)
-
 
     payload = {"sub": str(user.id)}
     return TokenPair(
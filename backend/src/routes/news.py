@@ -1,20 +1,50 @@
+import asyncio
+import time
 from typing import List, Optional, Literal
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from datetime import datetime
 
-from tortoise.functions import Max
+import orjson
+from redis.asyncio import Redis
 
 from orm.models import Topic, User, UserArticleState, Cluster
-from schemes.base import CursorPage, ToggleRequest
-from schemes.news import TopicOut
-from utils.auth import get_current_user, get_optional_user
-from utils.cursor import make_cursor_weight, make_cursor_recent
+from schemes.base import ToggleRequest
+from schemes.news import TopicOut, NewsListResponse, SuggestResponse, ClusterDetailResponse, NewsChangesResponse
+from routes.auth import get_redis
+from utils.auth import get_current_user, get_optional_user, get_optional_context
+from settings import settings
+from utils.cluster_detail import load_cluster_page
+from utils.cursor import feed_fingerprint, parse_feed_cursor
 from utils.enums import Language
-from utils.news import fetch_articles_for_clusters, fetch_cluster_flags, fetch_user_source_ranks, pick_primary, \
-    apply_cluster_filters, resolve_allowed_source_ids, apply_keyset_cursor
+from utils.etag import make_etag, is_not_modified, not_modified, set_etag, catalog_generation, \
+    get_user_version, bump_user_version
+from utils.feed import select_feed_page, stream_feed_clusters, page_fingerprint
+from utils.feed_cache import feed_cache_key, get_cached_page, set_cached_page
+from utils.front_page import FrontPageSnapshot
+from utils.hot_feed import HotFeedIndex
+from utils.notify import ArticleNotifier
+from utils.search_cache import get_search_hits, hits_truncated
+from utils.suggest import fetch_suggestions
+from utils.sync import fetch_changes
+from utils.user_context import UserContext
+from utils.news import fetch_cluster_flags, resolve_allowed_sources, build_feed_items, \
+    resolve_article_fields, ARTICLE_FIELDS, fetch_articles_for_clusters
 
-router = APIRouter(prefix="/news", tags=["news"])
+router = APIRouter(prefix="/news", tags=["news"], default_response_class=ORJSONResponse)
+
+
+def get_front_page(request: Request) -> FrontPageSnapshot:
+    return request.app.state.front_page
+
+
+def get_notifier(request: Request) -> ArticleNotifier:
+    return request.app.state.notifier
+
+
+def get_hot_feed(request: Request) -> Optional[HotFeedIndex]:
+    return request.app.state.hot_feed
 
 
 async def update_user_cluster_state(user: User, cluster_id: int, **kwargs) -> bool:
@@ -31,25 +61,57 @@ async def update_user_cluster_state(user: User, cluster_id: int, **kwargs) -> bo
 
 
 @router.get("/topics/all", response_model=List[TopicOut])
-async def list_topics():
+async def list_topics(request: Request, response: Response):
+    etag = make_etag("topics", await catalog_generation())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     rows = await Topic.all().order_by("id")
     return [TopicOut(id=r.id, title=r.title) for r in rows]
 
 
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    language: Optional[Language] = Query(None),
+    limit: int = Query(8, ge=1, le=20),
+):
+    """Автодополнение строки поиска из search_suggest — без запроса ленты на каждый символ."""
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return await fetch_suggestions(q, language, limit)
+
+
 @router.post("/{cluster_id}/read")
-async def toggle_read(cluster_id: int, body: ToggleRequest, user: User = Depends(get_current_user)):
-    return {"ok": await update_user_cluster_state(user, cluster_id, read=bool(body.value))}
+async def toggle_read(
+    cluster_id: int, body: ToggleRequest,
+    user: User = Depends(get_current_user), r: Redis = Depends(get_redis)
+):
+    ok = await update_user_cluster_state(user, cluster_id, read=bool(body.value))
+    await bump_user_version(r, user.id)
+    return {"ok": ok}
 
 
 @router.post("/{cluster_id}/bookmark")
-async def toggle_bookmark(cluster_id: int, body: ToggleRequest, user: User = Depends(get_current_user)):
-    return {"ok": await update_user_cluster_state(user, cluster_id, bookmarked=bool(body.value))}
+async def toggle_bookmark(
+    cluster_id: int, body: ToggleRequest,
+    user: User = Depends(get_current_user), r: Redis = Depends(get_redis)
+):
+    ok = await update_user_cluster_state(user, cluster_id, bookmarked=bool(body.value))
+    await bump_user_version(r, user.id)
+    return {"ok": ok}
 
 
 
-@router.get("/all", response_model=CursorPage)
+@router.get("/all", response_model=NewsListResponse, response_model_exclude_unset=True)
 async def list_articles_grouped(
+    request: Request,
+    response: Response,
     user: User = Depends(get_optional_user),
+    ctx: Optional[UserContext] = Depends(get_optional_context),
+    r: Redis = Depends(get_redis),
+    front_page: FrontPageSnapshot = Depends(get_front_page),
+    hot_feed: Optional[HotFeedIndex] = Depends(get_hot_feed),
 
     # фильтры
     topic_ids: Optional[List[int]] = Query(None),
@@ -59,91 +121,305 @@ async def list_articles_grouped(
     until: Optional[datetime] = Query(None),
 
     # выборка внутри кластера
-    max_articles_per_cluster: int = Query(6, ge=1, le=11),
+    max_articles_per_cluster: int = Query(settings.feed.page_max_articles, ge=1, le=11),
     order_in_cluster: Literal["date_desc", "date_asc"] = "date_desc",
     bookmarkOnly: bool = Query(False),
+    fields: Optional[str] = Query(None, description="поля статьи через запятую, напр. title,url,published_at"),
+    view: Literal["full", "compact"] = "full",
 
     # сортировка/пагинация кластеров
     sort: Literal["recent", "weight"] = "recent",
-    limit: int = Query(5, ge=1, le=21),
+    limit: int = Query(settings.feed.page_limit, ge=1, le=21),
     cursor: Optional[str] = None,
 ):
-    # 0) Разрешённые источники
-    allowed = await resolve_allowed_source_ids(user)
+    article_fields = resolve_article_fields(fields, view)
+
+    # 0) Аноним без фильтров — готовый снимок как есть, без единого запроса в БД
+    if user is None and not (topic_ids or language or q or since or until) and front_page.matches(
+        limit=limit, max_articles_per_cluster=max_articles_per_cluster, order_in_cluster=order_in_cluster
+    ) and article_fields == ARTICLE_FIELDS:
+        blob, stamp = await front_page.get(sort, cursor)
+        if blob is not None:
+            etag = make_etag("front", stamp, sort, cursor)
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+            return Response(
+                content=blob, media_type="application/json",
+                headers={"ETag": etag, "Cache-Control": "no-cache"},
+            )
+
+    # 0.1) Разрешённые источники (вместе с их поколениями для кэша)
+    generations = await resolve_allowed_sources(ctx)
+    allowed = list(generations)
+
+    # 0.2) ETag из поколений источников и версии состояния пользователя — до тяжёлых запросов.
+    #      Вес кластеров меняет телеметрия, поэтому для sort=weight добавляем корзину времени.
+    version = await get_user_version(r, user.id if user else None)
+    if version is not None:
+        weight_bucket = int(time.time() // settings.feed.cache_ttl_sec) if sort == "weight" else None
+        etag = make_etag(
+            user.id if user else None, version, generations, weight_bucket, bookmarkOnly,
+            sorted(topic_ids or []), language, q, since, until,
+            max_articles_per_cluster, order_in_cluster, sort, limit, cursor, article_fields,
+        )
+        if is_not_modified(request, etag):
+            return not_modified(etag, "private, no-cache" if user else "no-cache")
+        set_etag(response, etag, "private, no-cache" if user else "no-cache")
+
     if not allowed:
         return {"items": [], "next_cursor": None}
 
-    # 1) Базовый запрос по кластерам + фильтры
-    cqs = Cluster.filter(articles__source_id__in=allowed).distinct()
-    cqs = apply_cluster_filters(
-        cqs,
+    params = dict(
         topic_ids=topic_ids,
         language=language,
         q=q,
-        bookmarkOnly=bookmarkOnly,
-        user=user
+        since=since,
+        until=until,
+        max_articles_per_cluster=max_articles_per_cluster,
+        order_in_cluster=order_in_cluster,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+        article_fields=article_fields,
     )
 
-    # 1.1) Аннотация "последней публикации" по моим источникам
-    cqs = cqs.annotate(last_pub=Max("articles__published_at"))
+    # 1) Общая часть страницы: из кэша, иначе из БД.
+    #    bookmarkOnly зависит от пользователя — такие страницы не кэшируем.
+    cache_key = None
+    if not (user and bookmarkOnly):
+        cache_key = feed_cache_key(generations, **{**params, "topic_ids": sorted(topic_ids or [])})
+    page = await get_cached_page(r, cache_key) if cache_key else None
+    cluster_flags = ranks = None
+    if page is None and hot_feed is not None and hot_feed.ready and hot_feed.eligible(
+        sort=sort, q=q, topic_ids=topic_ids, bookmarkOnly=bookmarkOnly, until=until
+    ):
+        # горячее окно в памяти: из БД только статьи выбранных кластеров
+        page = await hot_feed.select_page(
+            allowed,
+            fingerprint=page_fingerprint(sort, {**params, "bookmarkOnly": bookmarkOnly}),
+            language=language,
+            since=since,
+            max_articles_per_cluster=max_articles_per_cluster,
+            order_in_cluster=order_in_cluster,
+            limit=limit,
+            cursor=cursor,
+            article_fields=article_fields,
+        )
+        if page is not None and cache_key:
+            await set_cached_page(r, cache_key, page)
+    if page is None:
+        # ранжированный список поиска — из кэша по нормализованному запросу
+        search_hits = None
+        if q and settings.feed.engine == "sql":
+            search_hits = await get_search_hits(r, q, language)
+        page, cluster_flags, ranks = await select_feed_page(
+            allowed, user=user, bookmarkOnly=bookmarkOnly, search_hits=search_hits, **params
+        )
+        if hits_truncated(search_hits) and len(page["clusters"]) < limit:
+            # глобальный топ кэша кончился раньше страницы (нишевые источники, окно since/until) —
+            # тот же запрос без кэша, поиск только по разрешённым источникам
+            page, cluster_flags, ranks = await select_feed_page(
+                allowed, user=user, bookmarkOnly=bookmarkOnly, **params
+            )
+        if cache_key:
+            await set_cached_page(r, cache_key, page)
+
+    clusters = page["clusters"]
+    if not clusters:
+        return {"items": [], "next_cursor": page["next_cursor"]}
 
-    # 1.2) Сортировка
-    if sort == "weight":
-        order_by = ("-weight", "-last_pub", "-id")
-    else:
-        order_by = ("-last_pub", "-id")
-    if q:
-        order_by = ("-best_rank",) + order_by
-    cqs = cqs.order_by(*order_by)
+    # 2) Кластерные флаги (bookmarked/read) и ранги источников — поверх кэша
+    if cluster_flags is None:
+        cluster_flags = await fetch_cluster_flags(user, [c["cluster_id"] for c in clusters])
+        ranks = ctx.ranks if ctx else {}
 
-    # 1.3) Курсор (keyset) — корректный для конкретной сортировки
-    cqs = apply_keyset_cursor(cqs, sort=sort, cursor=cursor)
-    clusters = await cqs.limit(limit)
+    # 3) Сборка ответа (article + other_articles + флаги)
+    items = build_feed_items(clusters, cluster_flags, ranks)
+    return {"items": items, "next_cursor": page["next_cursor"]}
 
-    if not clusters:
-        return {"items": [], "next_cursor": None}
 
-    cluster_ids = [c.id for c in clusters]
+@router.get("/stream")
+async def stream_articles_grouped(
+    user: User = Depends(get_optional_user),
+    ctx: Optional[UserContext] = Depends(get_optional_context),
+    r: Redis = Depends(get_redis),
+
+    # фильтры
+    topic_ids: Optional[List[int]] = Query(None),
+    language: Optional[Language] = Query(None),
+    q: Optional[str] = Query(None, min_length=2),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+
+    # выборка внутри кластера
+    max_articles_per_cluster: int = Query(settings.feed.page_max_articles, ge=1, le=11),
+    order_in_cluster: Literal["date_desc", "date_asc"] = "date_desc",
+    bookmarkOnly: bool = Query(False),
+    fields: Optional[str] = Query(None, description="поля статьи через запятую, напр. title,url,published_at"),
+    view: Literal["full", "compact"] = "full",
+
+    # сортировка/пагинация кластеров
+    sort: Literal["recent", "weight"] = "recent",
+    count: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """
+    Предзагрузка: до count кластеров одним запросом в NDJSON — по строке на элемент ленты
+    (как в /news/all) и последней строкой {"next_cursor": ...}.
+    Источники, ранги и курсор БД живут весь поток.
+    """
+    article_fields = resolve_article_fields(fields, view)
+    # курсор проверяем до начала потока — потом статус уже не поменять
+    if cursor:
+        fingerprint = feed_fingerprint(
+            sort=sort, topic_ids=topic_ids, language=language, q=q,
+            since=since, until=until, bookmarkOnly=bookmarkOnly,
+        )
+        parse_feed_cursor(cursor, sort=sort, fingerprint=fingerprint, ranked=bool(q))
+
+    allowed = list(await resolve_allowed_sources(ctx))
+    search_hits = await get_search_hits(r, q, language) if allowed and q else None
+
+    async def lines():
+        next_cursor, streamed = None, 0
+        # второй проход — без кэша поиска, если обрезанный список кончился раньше count
+        passes = [search_hits, None] if hits_truncated(search_hits) else [search_hits]
+        for hits in passes if allowed else []:
+            if streamed >= count:
+                break
+            async for item, next_cursor in stream_feed_clusters(
+                allowed,
+                user=user,
+                topic_ids=topic_ids,
+                language=language,
+                q=q,
+                since=since,
+                until=until,
+                max_articles_per_cluster=max_articles_per_cluster,
+                order_in_cluster=order_in_cluster,
+                bookmarkOnly=bookmarkOnly,
+                sort=sort,
+                limit=count - streamed,
+                cursor=next_cursor or cursor,
+                search_hits=hits,
+                article_fields=article_fields,
+            ):
+                streamed += 1
+                if item is not None:
+                    yield orjson.dumps(item) + b"\n"
+        yield orjson.dumps({"next_cursor": next_cursor}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/events")
+async def news_events(
+    request: Request,
+    user: User = Depends(get_optional_user),
+    ctx: Optional[UserContext] = Depends(get_optional_context),
+    notifier: ArticleNotifier = Depends(get_notifier),
+):
+    """
+    SSE «появились новые истории»: событие cluster с {cluster_id, source_id, created_new, prev_cluster_id}
+    для источников пользователя — клиент догружает только дельту вместо опроса /news/all.
+    """
+    queue = notifier.register(set(await resolve_allowed_sources(ctx)))
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if not notifier.is_registered(queue):
+                        break
+                    yield b": keepalive\n\n"
+                    continue
+                yield b"event: cluster\ndata: " + orjson.dumps(data) + b"\n\n"
+        finally:
+            notifier.unregister(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/changes", response_model=NewsChangesResponse, response_model_exclude_unset=True)
+async def news_changes(
+    user: User = Depends(get_optional_user),
+    ctx: Optional[UserContext] = Depends(get_optional_context),
+    since_token: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    max_articles_per_cluster: int = Query(6, ge=1, le=11),
+    fields: Optional[str] = Query(None),
+    view: Literal["full", "compact"] = "full",
+):
+    """
+    Кластеры, созданные или изменённые (новые статьи, вес) после since_token, в элементах ленты.
+    Без токена — пустой ответ и начальный токен. has_more — сразу запросить следующую порцию.
+    """
+    article_fields = resolve_article_fields(fields, view)
+    allowed = list(await resolve_allowed_sources(ctx))
+    cluster_ids, next_token, has_more = await fetch_changes(allowed, since_token=since_token, limit=limit)
+    if not cluster_ids:
+        return {"items": [], "next_token": next_token, "has_more": has_more}
 
-    # 2) Внутренние статьи кластеров (только из allowed)
     grouped = await fetch_articles_for_clusters(
         cluster_ids=cluster_ids,
         allowed_source_ids=allowed,
-        since=since,
-        until=until,
-        order_in_cluster=order_in_cluster,
-        max_articles_per_cluster=max_articles_per_cluster
+        since=None,
+        until=None,
+        order_in_cluster="date_desc",
+        max_articles_per_cluster=max_articles_per_cluster,
+        article_fields=article_fields,
     )
-
-    # 3) Кластерные флаги (bookmarked/read) и ранги источников
+    clusters = [{"cluster_id": cid, "articles": grouped[cid]} for cid in cluster_ids if grouped.get(cid)]
     cluster_flags = await fetch_cluster_flags(user, cluster_ids)
-    ranks = await fetch_user_source_ranks(user, allowed)
-
-    # 4) Сборка ответа (article + other_articles + флаги)
-    items = []
-    for cid in cluster_ids:
-        lst = grouped.get(cid, [])
-        if not lst:
-            continue
-        primary = pick_primary(lst, ranks)
-        others = [it for it in lst if it["id"] != primary["id"]]
-        flags = cluster_flags.get(cid, {})
-        items.append({
-            "cluster_id": cid,
-            "article": primary,
-            "other_articles": others,
-            "bookmarked": bool(flags.get("bookmarked", False)),
-            "read": bool(flags.get("read", False)),
-        })
-
-    # 5) next_cursor — по последнему кластеру
-
-    last = clusters[-1]
-    last_pub = getattr(last, "last_pub") or getattr(last, "first_published_at")
-
-    if sort == "weight":
-        next_cursor = make_cursor_weight(getattr(last, "weight") or 0, last_pub, last.id)
-    else:
-        next_cursor = make_cursor_recent(last_pub, last.id)
-
-    return {"items": items, "next_cursor": next_cursor}
\ No newline at end of file
+    ranks = ctx.ranks if ctx else {}
+    return {
+        "items": build_feed_items(clusters, cluster_flags, ranks),
+        "next_token": next_token,
+        "has_more": has_more,
+    }
+
+
+# {cluster_id:int} — не перехватывает /all, /stream, /events, /suggest
+@router.get("/{cluster_id:int}", response_model=ClusterDetailResponse, response_model_exclude_unset=True)
+async def cluster_detail(
+    cluster_id: int,
+    user: User = Depends(get_optional_user),
+    r: Redis = Depends(get_redis),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None),
+    view: Literal["full", "compact"] = "full",
+):
+    """
+    Инфоповод целиком: кластер, все его статьи страницами от свежих к старым и флаги пользователя.
+    Страница статей общая для всех и кэшируется, пока в кластер не пришла новая статья.
+    """
+    cluster = await Cluster.get_or_none(id=cluster_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="cluster not found")
+
+    page = await load_cluster_page(
+        r, cluster, limit=limit, cursor=cursor, article_fields=resolve_article_fields(fields, view)
+    )
+    flags = (await fetch_cluster_flags(user, [cluster.id])).get(cluster.id, {})
+    return {
+        "cluster": {
+            "id": cluster.id,
+            "language": str(cluster.language),
+            "weight": cluster.weight,
+            "first_published_at": cluster.first_published_at.isoformat() if cluster.first_published_at else None,
+            "last_published_at": cluster.last_published_at.isoformat() if cluster.last_published_at else None,
+            "article_count": cluster.article_count,
+            "source_count": cluster.source_count,
+        },
+        "articles": page["articles"],
+        "next_cursor": page["next_cursor"],
+        "bookmarked": bool(flags.get("bookmarked", False)),
+        "read": bool(flags.get("read", False)),
+    }
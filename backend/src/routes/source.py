@@ -1,39 +1,50 @@
 from typing import Optional, List
 
-from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 
+from redis.asyncio import Redis
 from tortoise.transactions import in_transaction
 
 from orm.models import User, Source, UserSource
+from routes.auth import get_redis
 from schemes.source import UserSourceOut, SourceCreate, SourceOut, UserSourceUpdate, SourceCatalogItem
 from utils.auth import get_current_user, get_optional_user
 from utils.enums import SourceKind, SourceStatus
+from utils.etag import make_etag, is_not_modified, not_modified, set_etag, catalog_generation, \
+    get_user_version, bump_user_version
 from utils.redis import RedisBroker
+from utils.subscriptions import subscribe, unsubscribe, materialize, virtual_user_source_id, \
+    DEFAULT_RANK, DEFAULT_POLL_INTERVAL_SEC
+from utils.user_context import UserContextCache, get_user_contexts
 
-router = APIRouter(prefix="/source", tags=["source"])
+router = APIRouter(prefix="/source", tags=["source"], default_response_class=ORJSONResponse)
 
 
 def get_broker(request: Request) -> RedisBroker:
     return request.app.state.broker
 
 
-async def build_user_source_out(us: UserSource) -> UserSourceOut:
-    src = await us.source
+def build_user_source_out(src: Source, us: Optional[UserSource] = None) -> UserSourceOut:
+    """us=None — неявная подписка на источник по умолчанию (id = -source_id)."""
     return UserSourceOut(
-        id=us.id,
+        id=us.id if us else virtual_user_source_id(src.id),
         source=SourceOut(
             id=src.id, kind=src.kind,
             domain=src.domain, status=src.status,
             created_at=src.created_at.isoformat()
         ),
-        poll_interval_sec=us.poll_interval_sec,
-        rank=us.rank,
-        created_at=us.created_at.isoformat()
+        poll_interval_sec=us.poll_interval_sec if us else DEFAULT_POLL_INTERVAL_SEC,
+        rank=us.rank if us else DEFAULT_RANK,
+        created_at=(us or src).created_at.isoformat()
     )
 
 
 @router.post("/create", response_model=UserSourceOut)
-async def create_source(payload: SourceCreate, user: User = Depends(get_current_user)):
+async def create_source(
+    payload: SourceCreate, user: User = Depends(get_current_user), r: Redis = Depends(get_redis),
+    contexts: UserContextCache = Depends(get_user_contexts),
+):
     """
     Создаёт Source (если такого (kind,domain) нет) и тут же подключает его пользователю (UserSource).
     Редактировать/удалять Source нельзя — только свой UserSource.
@@ -42,25 +53,37 @@ async def create_source(payload: SourceCreate, user: User = Depends(get_current_
         src, _ = await Source.get_or_create(
             kind=payload.kind, domain=payload.domain
         )
-        us, _ = await UserSource.get_or_create(user_id=user.id, source_id=src.id)
+        us = await subscribe(user.id, src)
+    await bump_user_version(r, user.id)
+    await contexts.invalidate(user.id)
     # возврат
-    return await build_user_source_out(us)
+    return build_user_source_out(src, us)
 
 
 @router.post("/{source_id}", response_model=UserSourceOut)
-async def add_user_source(source_id: int, user: User = Depends(get_current_user)):
+async def add_user_source(
+    source_id: int, user: User = Depends(get_current_user), r: Redis = Depends(get_redis),
+    contexts: UserContextCache = Depends(get_user_contexts),
+):
     if not (source := await Source.get_or_none(id=source_id)):
         raise HTTPException(404, "Not found")
-    us, created = await UserSource.get_or_create(user=user, source=source)
-    return await build_user_source_out(us)
+    us = await subscribe(user.id, source)
+    await bump_user_version(r, user.id)
+    await contexts.invalidate(user.id)
+    return build_user_source_out(source, us)
 
 
 @router.delete("/{source_id}")
-async def remove_user_source(source_id: int, user: User = Depends(get_current_user)):
-    us = await UserSource.get_or_none(source_id=source_id, user_id=user.id)
-    if not us:
+async def remove_user_source(
+    source_id: int, user: User = Depends(get_current_user), r: Redis = Depends(get_redis),
+    contexts: UserContextCache = Depends(get_user_contexts),
+):
+    source = await Source.get_or_none(id=source_id)
+    # от источника по умолчанию отписывает строка-исключение, а не удаление
+    if not source or not await unsubscribe(user.id, source):
         raise HTTPException(404, "Not found")
-    await us.delete()
+    await bump_user_version(r, user.id)
+    await contexts.invalidate(user.id)
     return {"ok": True}
 
 
@@ -68,16 +91,34 @@ async def remove_user_source(source_id: int, user: User = Depends(get_current_us
 async def list_my_sources(
     user: User = Depends(get_current_user)
 ) -> List[UserSourceOut]:
-    qs = UserSource.filter(user_id=user.id).prefetch_related("source").order_by("id")
-    return [await build_user_source_out(us) for us in await qs]
+    rows = await UserSource.filter(user_id=user.id).prefetch_related("source").order_by("id")
+    # источники по умолчанию без своей строки — неявные подписки
+    implicit = await Source.filter(is_default=True).exclude(
+        id__in=[us.source_id for us in rows]
+    ).order_by("id")
+    return [build_user_source_out(src) for src in implicit] + [
+        build_user_source_out(us.source, us) for us in rows if not us.excluded
+    ]
 
 
 @router.get("/all")
 async def catalog_sources(
+    request: Request,
+    response: Response,
     user: Optional[User] = Depends(get_optional_user),
+    r: Redis = Depends(get_redis),
     kind: Optional[SourceKind] = Query(None),
     status: Optional[SourceStatus] = Query(None)
 ) -> List[SourceCatalogItem]:
+    # ETag: поколение каталога + версия подключений пользователя
+    version = await get_user_version(r, user.id if user else None)
+    if version is not None:
+        etag = make_etag("catalog", await catalog_generation(), user.id if user else None, version, kind, status)
+        cache_control = "private, no-cache" if user else "no-cache"
+        if is_not_modified(request, etag):
+            return not_modified(etag, cache_control)
+        set_etag(response, etag, cache_control)
+
     qs = Source.filter(status=SourceStatus.ACTIVE).order_by("id")
 
     if kind:
@@ -90,28 +131,45 @@ async def catalog_sources(
     if user:
         links = await UserSource.filter(
             user_id=user.id,
-            source_id__in=[r.id for r in rows]
-        ).values("id","source_id")
-        connected_map = {l["source_id"]: l["id"] for l in links}
+            source_id__in=[src.id for src in rows]
+        ).values("id", "source_id", "excluded")
+        links = {l["source_id"]: l for l in links}
+        for src in rows:
+            link = links.get(src.id)
+            if link is None and src.is_default:
+                connected_map[src.id] = virtual_user_source_id(src.id)
+            elif link is not None and not link["excluded"]:
+                connected_map[src.id] = link["id"]
 
     return sorted([
         SourceCatalogItem(
-            id=r.id, kind=r.kind, domain=r.domain, status=r.status,
-            created_at=r.created_at.isoformat(),
-            connected=(r.id in connected_map),
-            user_source_id=connected_map.get(r.id)
+            id=src.id, kind=src.kind, domain=src.domain, status=src.status,
+            created_at=src.created_at.isoformat(),
+            connected=(src.id in connected_map),
+            user_source_id=connected_map.get(src.id)
         )
-        for r in rows
+        for src in rows
     ], key=lambda i: i.connected, reverse=True)
 
 
 @router.patch("/update/{user_source_id}", response_model=UserSourceOut)
-async def update_source(user_source_id: int, body: UserSourceUpdate, user: User = Depends(get_current_user)):
-    us = await UserSource.get_or_none(id=user_source_id, user_id=user.id).prefetch_related("source")
+async def update_source(
+    user_source_id: int, body: UserSourceUpdate,
+    user: User = Depends(get_current_user), r: Redis = Depends(get_redis),
+    contexts: UserContextCache = Depends(get_user_contexts),
+):
+    if user_source_id < 0:
+        # неявная подписка: строка появляется только сейчас, при первом изменении
+        us = await materialize(user.id, -user_source_id)
+    else:
+        us = await UserSource.get_or_none(id=user_source_id, user_id=user.id, excluded=False)
     if not us:
         raise HTTPException(404, "Not found")
+    await us.fetch_related("source")
     patch = body.model_dump(exclude_unset=True)
     for k, v in patch.items():
         setattr(us, k, v)
     await us.save()
-    return await build_user_source_out(us)
+    await bump_user_version(r, user.id)
+    await contexts.invalidate(user.id)
+    return build_user_source_out(us.source, us)
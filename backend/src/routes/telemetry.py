@@ -1,43 +1,51 @@
-from fastapi import APIRouter
-from tortoise.expressions import F
-from datetime import datetime, timezone
-from orm.models import Cluster
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from routes.auth import get_redis
 from schemes.telemetry import EventBatch
+from settings import settings
+from utils.telemetry import apply_deltas, buffer_deltas, decode_body, flush_lag, sum_deltas
 
 router = APIRouter(prefix="/telemetry", tags=["telemetry"])
 
 
 @router.post("/events")
-async def ingest(batch: EventBatch):
-    deltas = {}
-    now = datetime.now(timezone.utc)
-
-    for ev in batch.events:
-        if ev.type == "impression":
-            delta = 1.0
-        elif ev.type == "dwell":
-            secs = (ev.dwell_ms or 0) / 1000.0
-            delta = max(0.0, int(secs // 5)) * 1.0
-        elif ev.type == "click":
-            delta = 5.0
-        elif ev.type == "outbound":
-            delta = 8.0
-        else:
-            delta = 0.0
-
-        if delta <= 0 or not ev.cluster_id:
-            continue
-
-        try:
-            cl = await Cluster.get(id=ev.cluster_id)
-            hours = max(0.0, (now - cl.first_published_at.replace(tzinfo=timezone.utc)).total_seconds() / 3600.0)
-            recency = 2.718281828 ** (-hours / 48.0)
-        except Exception:
-            recency = 1.0
-
-        deltas[ev.cluster_id] = deltas.get(ev.cluster_id, 0.0) + delta * recency
-
-    for cid, d in deltas.items():
-        await Cluster.filter(id=cid).update(weight=F("weight") + int(round(d)))
-
-    return {"status": "ok", "updated": len(deltas)}
+async def ingest(request: Request, r: Redis = Depends(get_redis)):
+    """
+    Пачка событий {"events": [...]}, тело можно сжать (Content-Encoding: gzip).
+    Вклад копится в Redis и уходит в cluster.weight фоном (TelemetryFlusher) —
+    горячие кластеры не блокируются на каждом POST.
+    """
+    # сжатое тело тоже не больше лимита — читаем потоком и обрываем сразу
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > settings.telemetry.max_body_bytes:
+            raise HTTPException(status_code=413, detail="telemetry batch too large")
+    raw = decode_body(
+        bytes(body),
+        request.headers.get("content-encoding", ""),
+        max_bytes=settings.telemetry.max_body_bytes,
+    )
+    try:
+        batch = EventBatch.model_validate_json(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    if len(batch.events) > settings.telemetry.max_events:
+        raise HTTPException(status_code=413, detail="too many events in batch")
+
+    deltas = sum_deltas(batch.events)
+    try:
+        await buffer_deltas(r, deltas, bucket_sec=settings.telemetry.bucket_sec)
+    except RedisError:
+        # без Redis — сразу в БД, как раньше
+        return {"status": "ok", "updated": await apply_deltas(deltas)}
+    return {"status": "ok", "buffered": len(deltas)}
+
+
+@router.get("/lag")
+async def telemetry_lag(r: Redis = Depends(get_redis)):
+    """Метрика отложенной записи: отставание переноса весов в БД и число ждущих корзин."""
+    return await flush_lag(r, bucket_sec=settings.telemetry.bucket_sec)
@@ -8,22 +8,59 @@ class TopicOut(BaseModel):
 
 
 class ArticleOut(BaseModel):
+    # без fields=/view=compact — все поля; иначе только запрошенные
     id: int
-    title: str
-    url: str
     source_id: int
-    source_name: str
-    published_at: Optional[str]
+    source_domain: Optional[str] = None
+    url: Optional[str] = None
+    title: str
+    summary: Optional[str] = None
+    published_at: Optional[str] = None
+    image: Optional[str] = None
 
 
 class ClusterItem(BaseModel):
     cluster_id: int
     article: ArticleOut
     other_articles: List[ArticleOut] = []
-    is_bookmarked: bool = False
-    is_read: bool = False
+    bookmarked: bool = False
+    read: bool = False
 
 
 class NewsListResponse(BaseModel):
     items: List[ClusterItem]
     next_cursor: Optional[str] = None
+
+
+class NewsChangesResponse(BaseModel):
+    items: List[ClusterItem]
+    next_token: str
+    has_more: bool = False
+
+
+class SuggestCluster(BaseModel):
+    cluster_id: int
+    title: str
+
+
+class SuggestResponse(BaseModel):
+    terms: List[str] = []
+    clusters: List[SuggestCluster] = []
+
+
+class ClusterOut(BaseModel):
+    id: int
+    language: str
+    weight: int
+    first_published_at: Optional[str] = None
+    last_published_at: Optional[str] = None
+    article_count: int
+    source_count: int
+
+
+class ClusterDetailResponse(BaseModel):
+    cluster: ClusterOut
+    articles: List[ArticleOut]
+    next_cursor: Optional[str] = None
+    bookmarked: bool = False
+    read: bool = False
@@ -19,7 +19,7 @@ class SourceOut(BaseModel):
 
 
 class UserSourceOut(BaseModel):
-    id: int
+    id: int                      # < 0 — неявная подписка на источник по умолчанию (-source_id)
     source: SourceOut
     poll_interval_sec: int
     rank: int
@@ -38,5 +38,5 @@ class SourceCatalogItem(BaseModel):
     status: SourceStatus
     parser_profile: Optional[str] = None
     created_at: str
-    connected: bool              # есть ли UserSource у текущего юзера
+    connected: bool              # подписан ли текущий юзер (в т.ч. неявно — источник по умолчанию)
     user_source_id: Optional[int] = None
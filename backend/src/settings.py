@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
@@ -26,6 +28,10 @@ class DBSettings(BaseSettings):
     def url(self):
         return f"asyncpg://{self.user}:{self.password}@db:5432/{self.name}"
 
+    @property
+    def dsn(self):
+        return f"postgresql://{self.user}:{self.password}@db:5432/{self.name}"
+
 # ---------- JWT ----------
 class JWTSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
@@ -42,6 +48,11 @@ class OTPSettings(BaseSettings):
     resend_sec: int = Field(60, alias="OTP_RESEND_SEC")
     max_attempts: int = Field(5, alias="OTP_MAX_ATTEMPTS")
     hash_salt: str = Field(..., alias="OTP_HASH_SALT")
+    # скользящие окна запросов кода (по телефону и IP) и проверок (по IP)
+    rate_window_sec: int = Field(3600, alias="OTP_RATE_WINDOW_SEC")
+    phone_max_requests: int = Field(5, alias="OTP_PHONE_MAX_REQUESTS")
+    ip_max_requests: int = Field(20, alias="OTP_IP_MAX_REQUESTS")
+    ip_max_verifies: int = Field(50, alias="OTP_IP_MAX_VERIFIES")
 
 
 class RedisSettings(BaseSettings):
@@ -59,12 +70,64 @@ class RedisSettings(BaseSettings):
         return f"redis://redis:6379/0"
 
 
+# ---------- FEED ----------
+class FeedSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
+    cache_ttl_sec: int = Field(120, alias="FEED_CACHE_TTL_SEC")
+    # sql — один CTE-запрос (utils/feed.py), orm — прежние хелперы utils/news.py
+    engine: Literal["sql", "orm"] = Field("sql", alias="FEED_ENGINE")
+    # форма страницы по умолчанию у /news/all и /news/stream — та, что запрашивает фронт
+    page_limit: int = Field(20, alias="FEED_PAGE_LIMIT")
+    page_max_articles: int = Field(10, alias="FEED_PAGE_MAX_ARTICLES")
+    # снимок анонимной ленты: K страниц формы по умолчанию
+    front_pages: int = Field(3, alias="FEED_FRONT_PAGES")
+    front_refresh_sec: float = Field(10.0, alias="FEED_FRONT_REFRESH_SEC")
+    # кэш поиска: корзина времени, сколько новых статей терпит запись, длина списка
+    search_bucket_sec: int = Field(300, alias="FEED_SEARCH_BUCKET_SEC")
+    search_max_new_articles: int = Field(200, alias="FEED_SEARCH_MAX_NEW_ARTICLES")
+    search_max_hits: int = Field(1000, alias="FEED_SEARCH_MAX_HITS")
+    # подсказки /news/suggest: окно в днях, минимум кластеров у слова, число заголовков
+    suggest_days: int = Field(7, alias="FEED_SUGGEST_DAYS")
+    suggest_min_freq: int = Field(2, alias="FEED_SUGGEST_MIN_FREQ")
+    suggest_max_titles: int = Field(5000, alias="FEED_SUGGEST_MAX_TITLES")
+    suggest_refresh_sec: float = Field(300.0, alias="FEED_SUGGEST_REFRESH_SEC")
+    # горячее окно ленты в памяти процесса (utils/hot_feed.py), по умолчанию выключено
+    hot_enabled: bool = Field(False, alias="FEED_HOT_ENABLED")
+    hot_window_hours: int = Field(72, alias="FEED_HOT_WINDOW_HOURS")
+    hot_reload_sec: float = Field(300.0, alias="FEED_HOT_RELOAD_SEC")
+    # пересчёт агрегатов кластеров из cluster_refresh_queue (utils/cluster_refresh.py)
+    aggregates_refresh_sec: float = Field(1.0, alias="FEED_AGGREGATES_REFRESH_SEC")
+    aggregates_batch: int = Field(1000, alias="FEED_AGGREGATES_BATCH")
+
+
+# ---------- TELEMETRY ----------
+class TelemetrySettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
+    # лимиты пачки /telemetry/events: событий и байт тела (после распаковки gzip)
+    max_events: int = Field(500, alias="TELEMETRY_MAX_EVENTS")
+    max_body_bytes: int = Field(1024 * 1024, alias="TELEMETRY_MAX_BODY_BYTES")
+    # отложенная запись весов: корзина накопления в Redis и период переноса в БД
+    bucket_sec: int = Field(10, alias="TELEMETRY_BUCKET_SEC")
+    flush_sec: float = Field(5.0, alias="TELEMETRY_FLUSH_SEC")
+
+
+# ---------- USER CONTEXT ----------
+class UserContextSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
+    # кэш user + источники + ранги (utils/user_context.py): TTL записи и размер LRU процесса
+    ttl_sec: int = Field(300, alias="USER_CONTEXT_TTL_SEC")
+    max_size: int = Field(10000, alias="USER_CONTEXT_MAX_SIZE")
+
+
 class Settings:
     app = AppSettings()
     db = DBSettings()
     jwt = JWTSettings()
     otp = OTPSettings()
     redis= RedisSettings()
+    feed = FeedSettings()
+    user_context = UserContextSettings()
+    telemetry = TelemetrySettings()
 
 
 settings = Settings()
\ No newline at end of file
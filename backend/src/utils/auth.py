@@ -4,13 +4,14 @@ import random
 import time
 from typing import Dict, Any, Optional, Type
 
-from fastapi import Depends, HTTPException, WebSocketException, status
+from fastapi import Depends, HTTPException, Request, WebSocketException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from fastapi.websockets import WebSocket
 
 from orm.models import User
 from settings import settings
+from utils.user_context import UserContext, UserContextCache
 
 
 def hash_code(code: str) -> str:
@@ -53,11 +54,12 @@ def decode_refresh_token(token: str) -> dict[str, Any]:
 security = HTTPBearer(auto_error=False)
 
 
-async def get_user(
+async def get_user_context(
         token: str,
+        contexts: UserContextCache,
         exception_class: Type[Exception] = HTTPException,
         **kwargs
-) -> User:
+) -> UserContext:
     try:
         payload = jwt.decode(
             token,
@@ -73,29 +75,46 @@ async def get_user(
         raise exception_class(**kwargs)
 
     sub = payload.get("sub")
-    if not sub:
+    if not sub or not str(sub).isdigit():
         raise exception_class(**kwargs)
 
-    user = await User.get_or_none(id=sub)
-    if not user:
+    # строка user, источники и ранги — из кэша контекста, без запросов в БД
+    ctx = await contexts.get(int(sub))
+    if not ctx:
         raise exception_class(**kwargs)
 
-    return user
+    return ctx
 
 
-async def get_current_user(
+async def get_current_context(
+    request: Request,
     creds: HTTPAuthorizationCredentials = Depends(security)
-) -> User:
+) -> UserContext:
     if creds is None:
         raise HTTPException(status_code=401, detail="auth required")
 
-    return await get_user(
+    return await get_user_context(
         creds.credentials,
+        request.app.state.user_context,
         status_code=status.HTTP_403_FORBIDDEN,
         detail="forbidden"
     )
 
 
+async def get_optional_context(
+    request: Request,
+    creds: HTTPAuthorizationCredentials = Depends(security)
+) -> Optional[UserContext]:
+    try:
+        return await get_current_context(request, creds)
+    except HTTPException:
+        return None
+
+
+async def get_current_user(ctx: UserContext = Depends(get_current_context)) -> User:
+    return ctx.user
+
+
 def parse_bearer(auth: Optional[str]) -> Optional[str]:
     if not auth: return None
     if auth.lower().startswith("bearer, "):
@@ -108,18 +127,15 @@ async def get_current_user_ws(websocket: WebSocket) -> User:
     if not token:
         raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
 
-    return await get_user(
-        token, WebSocketException,
+    ctx = await get_user_context(
+        token, websocket.app.state.user_context, WebSocketException,
         code=status.WS_1008_POLICY_VIOLATION,
         reason="forbidden"
     )
+    return ctx.user
 
 
 async def get_optional_user(
-        creds: HTTPAuthorizationCredentials = Depends(security)
+        ctx: Optional[UserContext] = Depends(get_optional_context)
 ) -> Optional[User]:
-    try:
-        return await get_current_user(creds)
-    except HTTPException:
-        return None
-
+    return ctx.user if ctx else None
@@ -0,0 +1,91 @@
+"""
+Карточка инфоповода: кластер и все его статьи страницами по (published_at, id)
+через индекс (cluster_id, published_at). Общая для всех часть страницы кэшируется в Redis
+по отметке агрегатов кластера — новая статья в кластере меняет ключ.
+"""
+import hashlib
+import json
+from typing import Optional, Sequence
+
+from redis.asyncio import Redis
+from tortoise import connections
+
+from orm.models import Cluster
+from utils.cursor import make_feed_cursor, parse_feed_cursor
+from utils.feed_cache import get_cached_page, set_cached_page
+from utils.news import article_select_sql, article_from_row
+
+CLUSTER_PREFIX = "cluster:page:"
+
+CLUSTER_ARTICLES_SQL = """
+SELECT {columns}
+FROM article a
+{source_join}
+WHERE a.cluster_id = $1 {after}
+ORDER BY a.published_at DESC, a.id DESC
+LIMIT $2
+"""
+
+
+def cluster_fingerprint(cluster_id: int) -> bytes:
+    """Курсор карточки годится только для своего кластера."""
+    return hashlib.blake2b(f"cluster:{cluster_id}".encode(), digest_size=8).digest()
+
+
+def cluster_cache_key(cluster: Cluster, **params) -> str:
+    # article_count/last_published_at пересчитывает drain_cluster_refresh_queue: статья пришла — ключ другой
+    stamp = [cluster.article_count, cluster.last_published_at.isoformat() if cluster.last_published_at else None]
+    raw = json.dumps([stamp, params], sort_keys=True, separators=(",", ":"), default=str)
+    return f"{CLUSTER_PREFIX}{cluster.id}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+async def fetch_cluster_articles(
+    cluster_id: int,
+    *,
+    limit: int,
+    cursor: Optional[str],
+    article_fields: Sequence[str],
+) -> dict:
+    """{"articles": [...], "next_cursor"} — от свежих к старым."""
+    columns, source_join = article_select_sql(article_fields)
+    values = [cluster_id, limit + 1]
+    after = ""
+    if cursor:
+        key = parse_feed_cursor(cursor, sort="recent", fingerprint=cluster_fingerprint(cluster_id), ranked=False)
+        after = "AND (a.published_at, a.id) < ($3, $4)"
+        values += [key.last_pub, key.cluster_id]
+
+    async with connections.get("default").acquire_connection() as conn:
+        rows = await conn.fetch(
+            CLUSTER_ARTICLES_SQL.format(columns=columns, source_join=source_join, after=after), *values
+        )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        # в поле id курсора — id статьи
+        next_cursor = make_feed_cursor(
+            sort="recent", fingerprint=cluster_fingerprint(cluster_id), rank=None,
+            weight=0, last_pub=last["published_at"], cid=last["article_id"],
+        )
+    return {"articles": [article_from_row(r, article_fields) for r in rows], "next_cursor": next_cursor}
+
+
+async def load_cluster_page(
+    r: Redis,
+    cluster: Cluster,
+    *,
+    limit: int,
+    cursor: Optional[str],
+    article_fields: Sequence[str],
+    ttl: Optional[int] = None,
+) -> dict:
+    key = cluster_cache_key(cluster, limit=limit, cursor=cursor, fields=list(article_fields))
+    page = await get_cached_page(r, key)
+    if page is None:
+        page = await fetch_cluster_articles(
+            cluster.id, limit=limit, cursor=cursor, article_fields=article_fields
+        )
+        await set_cached_page(r, key, page, ttl)
+    return page
@@ -0,0 +1,51 @@
+import asyncio
+import contextlib
+
+from tortoise import connections
+
+
+class ClusterRefresher:
+    """
+    Разбор cluster_refresh_queue: агрегаты кластеров (article_count, source_count,
+    last_published_at) и поисковые документы (cluster_search) пересчитываются
+    после коммита пачки парсера, а не внутри неё. Атомарность с upsert статьи
+    сознательно отдана за отсутствие блокировок кластеров в пачке: до разбора
+    (до refresh_sec) агрегаты отстают, но feed_generation источника и NOTIFY
+    поднимаются тем же проходом после них — кэш страниц и клиенты старых агрегатов
+    под новым поколением не увидят.
+    Работу делает один воркер — остальные упираются в advisory lock и пропускают цикл.
+    """
+
+    def __init__(self, *, interval: float, batch: int):
+        self._interval = interval
+        self._batch = batch
+        self._task: asyncio.Task | None = None
+
+    async def drain(self) -> int:
+        """Число пересчитанных кластеров за один проход."""
+        rows = await connections.get("default").execute_query_dict(
+            "SELECT drain_cluster_refresh_queue($1) AS refreshed", [self._batch]
+        )
+        return rows[0]["refreshed"] if rows else 0
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            while True:
+                refreshed = 0
+                with contextlib.suppress(Exception):
+                    refreshed = await self.drain()
+                # очередь не разобрана за проход — следующий сразу
+                if refreshed < self._batch:
+                    await asyncio.sleep(self._interval)
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
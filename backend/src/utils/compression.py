@@ -0,0 +1,31 @@
+from typing import Iterable
+
+from brotli_asgi import BrotliMiddleware
+
+
+class StreamingAwareCompression:
+    """
+    BrotliMiddleware для обычных ответов, потоки — мимо него: gzip-ответчик Starlette
+    не сбрасывает компрессор после чанка, и события SSE/строки NDJSON копятся в нём
+    вместо отправки клиенту.
+    """
+
+    def __init__(self, app, *, skip_paths: Iterable[str], **options):
+        self.app = app
+        self.compressed = BrotliMiddleware(app, **options)
+        self.skip_paths = tuple(skip_paths)
+
+    def _is_stream(self, scope) -> bool:
+        # путь сравниваем по окончанию: root_path (/api) может быть и не срезан прокси
+        if scope["path"].rstrip("/").endswith(self.skip_paths):
+            return True
+        for name, value in scope.get("headers", ()):
+            if name == b"accept" and b"text/event-stream" in value:
+                return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self._is_stream(scope):
+            await self.app(scope, receive, send)
+        else:
+            await self.compressed(scope, receive, send)
@@ -1,5 +1,15 @@
-from datetime import datetime, timezone
-from typing import Tuple
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, NamedTuple, Optional
+
+import orjson
+from fastapi import HTTPException
+
+from settings import settings
 
 
 def _to_utc(dt: datetime) -> datetime:
@@ -10,28 +20,98 @@ def _to_utc(dt: datetime) -> datetime:
         return dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICRO = timedelta(microseconds=1)
+
 def _to_micros(dt: datetime) -> int:
     dt = _to_utc(dt)
-    # микросекунды с эпохи — без потери точности
-    return int(dt.timestamp() * 1_000_000)
+    # микросекунды с эпохи — целочисленно, без float и потери точности
+    return (dt - _EPOCH) // _MICRO
 
 def _from_micros(us: int) -> datetime:
-    return datetime.fromtimestamp(us / 1_000_000, tz=timezone.utc)
+    return _EPOCH + timedelta(microseconds=us)
+
+# --- курсор ленты: версия | флаги | rank | weight | last_pub_us | id | отпечаток фильтров | HMAC ---
+
+CURSOR_VERSION = 1
+_FLAG_WEIGHT = 0x01
+_FLAG_RANKED = 0x02
+# rank — real (float32) из ts_rank_cd, чтобы сравнение в БД было точным
+_BODY = struct.Struct(">BBfqqI8s")
+_MAC_SIZE = 10
+_KEY = hashlib.sha256(b"feed-cursor:" + settings.jwt.secret.encode()).digest()
+
+
+class FeedCursor(NamedTuple):
+    rank: Optional[float]
+    weight: int
+    last_pub: datetime
+    cluster_id: int
+
+
+def feed_fingerprint(
+    *,
+    sort: str,
+    topic_ids: Optional[Iterable[int]],
+    language: Optional[str],
+    q: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    bookmarkOnly: bool,
+) -> bytes:
+    """8 байт от набора фильтров и сортировки: курсор годится только для той же выборки."""
+    raw = orjson.dumps([
+        sort,
+        sorted(topic_ids or []),
+        str(language or ""),
+        " ".join(q.lower().split()) if q else "",
+        _to_micros(since) if since else None,
+        _to_micros(until) if until else None,
+        bool(bookmarkOnly),
+    ])
+    return hashlib.blake2b(raw, digest_size=8).digest()
+
 
-# --- recent: (last_pub_us, id) ---
+def _mac(body: bytes) -> bytes:
+    return hmac.new(_KEY, body, hashlib.sha256).digest()[:_MAC_SIZE]
 
-def make_cursor_recent(last_pub: datetime, cid: int) -> str:
-    return f"{_to_micros(last_pub)}:{cid}"
 
-def parse_cursor_recent(s: str) -> Tuple[int, int]:
-    us_s, cid_s = s.split(":")
-    return int(us_s), int(cid_s)
+def make_feed_cursor(
+    *,
+    sort: str,
+    fingerprint: bytes,
+    rank: Optional[float],
+    weight: int,
+    last_pub: datetime,
+    cid: int,
+) -> str:
+    flags = (_FLAG_WEIGHT if sort == "weight" else 0) | (_FLAG_RANKED if rank is not None else 0)
+    body = _BODY.pack(
+        CURSOR_VERSION, flags, float(rank or 0.0), int(weight or 0), _to_micros(last_pub), cid, fingerprint
+    )
+    return base64.urlsafe_b64encode(body + _mac(body)).rstrip(b"=").decode()
 
-# --- weight: (weight, last_pub_us, id) ---
 
-def make_cursor_weight(weight: int, last_pub: datetime, cid: int) -> str:
-    return f"{int(weight)}:{_to_micros(last_pub)}:{cid}"
+def parse_feed_cursor(s: str, *, sort: str, fingerprint: bytes, ranked: bool) -> FeedCursor:
+    """
+    Проверяет подпись, версию, сортировку и отпечаток фильтров.
+    Чужой или подделанный курсор — 400, а не тихо перемешанный порядок.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    body, mac = raw[:-_MAC_SIZE], raw[-_MAC_SIZE:]
+    if len(body) != _BODY.size or not hmac.compare_digest(mac, _mac(body)):
+        raise HTTPException(status_code=400, detail="invalid cursor")
 
-def parse_cursor_weight(s: str) -> Tuple[int, int, int]:
-    w_s, us_s, cid_s = s.split(":")
-    return int(w_s), int(us_s), int(cid_s)
\ No newline at end of file
+    version, flags, rank, weight, us, cid, fp = _BODY.unpack(body)
+    if version != CURSOR_VERSION:
+        raise HTTPException(status_code=400, detail="stale cursor")
+    if (
+        bool(flags & _FLAG_WEIGHT) != (sort == "weight")
+        or bool(flags & _FLAG_RANKED) != ranked
+        or not hmac.compare_digest(fp, fingerprint)
+    ):
+        raise HTTPException(status_code=400, detail="cursor does not match filters")
+    return FeedCursor(rank if ranked else None, weight, _from_micros(us), cid)
@@ -0,0 +1,61 @@
+import contextlib
+import hashlib
+from typing import Optional
+
+import orjson
+from fastapi import Request, Response
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from tortoise import connections
+
+USER_VERSION_PREFIX = "etag:user:"
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из дешёвой отметки версии (поколения, счётчики, параметры запроса)."""
+    raw = orjson.dumps(parts, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str, cache_control: str = "no-cache") -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_etag(response: Response, etag: str, cache_control: str = "no-cache") -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+async def catalog_generation() -> int:
+    """Растёт при любом изменении source/topic, видимом в каталоге (триггеры в БД)."""
+    # у свежей последовательности last_value = 1 и до первого nextval, и после него
+    rows = await connections.get("default").execute_query_dict(
+        "SELECT CASE WHEN is_called THEN last_value ELSE 0 END AS generation FROM catalog_generation_seq"
+    )
+    return rows[0]["generation"]
+
+
+async def get_user_version(redis: Redis, user_id: Optional[int]) -> Optional[int]:
+    """
+    Версия пользовательского состояния (флаги кластеров, подключённые источники, ранги).
+    Её поднимают роуты, которые это состояние меняют. None — Redis недоступен, без ETag.
+    """
+    if user_id is None:
+        return 0
+    try:
+        return int(await redis.get(f"{USER_VERSION_PREFIX}{user_id}") or 0)
+    except RedisError:
+        return None
+
+
+async def bump_user_version(redis: Redis, user_id: int) -> None:
+    with contextlib.suppress(RedisError):
+        await redis.incr(f"{USER_VERSION_PREFIX}{user_id}")
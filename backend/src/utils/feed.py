@@ -0,0 +1,377 @@
+"""
+Лента одним запросом: кластеры, их статьи, флаги пользователя и ранги источников
+собираются одним CTE-запросом на asyncpg-пуле под Tortoise, без гидрации моделей.
+Старый путь (utils/news.py) остаётся за FEED_ENGINE=orm.
+"""
+from datetime import datetime
+from typing import Optional, List, Literal, Dict, NamedTuple, Tuple, AsyncIterator, Sequence
+
+from asyncpg import Record
+from tortoise import connections
+
+from orm.models import User
+from settings import settings
+from utils.cursor import feed_fingerprint, make_feed_cursor, parse_feed_cursor
+from utils.enums import Language
+from utils.subscriptions import DEFAULT_RANK
+from utils.news import load_feed_page, build_feed_items, search_configs, ARTICLE_FIELDS, article_select_sql, \
+    article_from_row
+
+
+# последняя лексема запроса — префиксная (то же, что в apply_cluster_filters)
+PREFIX_TSQUERY_SQL = """(
+        CASE WHEN cardinality(arr)=0 THEN ''
+             WHEN cardinality(arr)=1 THEN arr[1] || ':*'
+             ELSE array_to_string(arr[1:cardinality(arr)-1] || (arr[cardinality(arr)] || ':*'), ' & ')
+        END
+    )::tsquery"""
+
+
+class SearchHits(NamedTuple):
+    """Ранжированные кластеры запроса из кэша поиска (utils/search_cache.py)."""
+    ids: List[int]
+    ranks: List[float]
+    # за списком есть совпадения хуже последнего ранга, которых в нём нет
+    truncated: bool = False
+
+
+class _Params:
+    """Позиционные параметры $1..$n для asyncpg."""
+
+    def __init__(self):
+        self.values: list = []
+
+    def add(self, value, cast: str) -> str:
+        self.values.append(value)
+        return f"${len(self.values)}::{cast}"
+
+
+def search_tsq_cte(p: _Params, q: str, configs: Sequence[str]) -> str:
+    """CTE tsq(language, query): по строке на язык, документ кластера ищется запросом своего языка."""
+    q_p = p.add(q, "text")
+    return "tsq AS (\n" + "\n    UNION ALL\n".join(
+        f"    SELECT '{cfg}' AS language, {PREFIX_TSQUERY_SQL} AS query\n"
+        "    FROM (SELECT regexp_split_to_array(plainto_tsquery("
+        f"'{cfg}'::regconfig, {q_p}"
+        ")::text, ' & ') AS arr) _"
+        for cfg in configs
+    ) + "\n)"
+
+
+def search_match_sql(configs: Sequence[str]) -> str:
+    """Условие на cse (cluster_search): язык литералом, чтобы план брал частичный индекс."""
+    return "(" + " OR ".join(
+        f"(cse.language = '{cfg}' AND cse.document @@ (SELECT query FROM tsq WHERE language = '{cfg}'))"
+        for cfg in configs
+    ) + ")"
+
+
+def build_feed_page_sql(
+    allowed_source_ids: List[int],
+    *,
+    user: Optional[User],
+    topic_ids: Optional[List[int]],
+    language: Optional[Language],
+    q: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    max_articles_per_cluster: int,
+    order_in_cluster: Literal["date_desc", "date_asc"],
+    bookmarkOnly: bool,
+    sort: Literal["recent", "weight"],
+    limit: int,
+    cursor: Optional[str],
+    search_hits: Optional[SearchHits] = None,
+    article_fields: Sequence[str] = ARTICLE_FIELDS,
+) -> Tuple[str, list]:
+    """
+    Запрос страницы: одна строка на статью (или одна строка с article_id = NULL на кластер
+    без статей в окне), в порядке ленты. Возвращает (sql, параметры).
+    search_hits — (cluster_ids, ranks) из кэша поиска: тогда q уже не ранжируется заново.
+    """
+    p = _Params()
+    uid = p.add(user.id if user else None, "int")
+    allowed = p.add(allowed_source_ids, "int[]")
+
+    ctes: List[str] = []
+    where: List[str] = []
+    having: List[str] = []
+    rank_sql = "0::real"
+    search_join = ""
+    # recent — last_pub по моим источникам (GROUP BY над cluster_source);
+    # weight — одна строка кластера: агрегаты, поддерживаемые в БД (weight, last_published_at)
+    grouped = sort != "weight"
+    last_pub_sql = "MAX(cs.last_published_at)" if grouped else "c.last_published_at"
+
+    if q and search_hits is not None:
+        # готовый ранжированный список из кэша поиска (utils/search_cache.py)
+        ids, ranks = search_hits.ids, search_hits.ranks
+        rank_sql = "MAX(hit.rank)" if grouped else "hit.rank"
+        search_join = (
+            f"JOIN unnest({p.add(ids, 'int[]')}, {p.add(ranks, 'real[]')}) AS hit(cluster_id, rank) "
+            "ON hit.cluster_id = c.id"
+        )
+    elif q:
+        configs = search_configs(language)
+        ctes.append(search_tsq_cte(p, q, configs))
+        # @@ по частичному GIN-индексу cluster_search своего языка, ранжируются только совпавшие
+        rank_sql = "ts_rank_cd(cse.document, tsq.query)"
+        if grouped:
+            rank_sql = f"MAX({rank_sql})"
+        search_join = (
+            "JOIN cluster_search cse ON cse.cluster_id = c.id\n"
+            "    JOIN tsq ON tsq.language = cse.language"
+        )
+        where.append(search_match_sql(configs))
+    if user and bookmarkOnly:
+        where.append(
+            "EXISTS (SELECT 1 FROM userarticlestate st "
+            f"WHERE st.cluster_id = c.id AND st.user_id = {uid} AND st.bookmarked)"
+        )
+    if topic_ids:
+        where.append(
+            "EXISTS (SELECT 1 FROM clustertopic ct "
+            f"WHERE ct.cluster_id = c.id AND ct.topic_id = ANY({p.add(topic_ids, 'int[]')}))"
+        )
+    if language:
+        where.append(f"c.language = {p.add(str(language), 'text')}")
+
+    # keyset по полному ключу сортировки — тот же порядок, что и в apply_keyset_cursor
+    if cursor:
+        fp = feed_fingerprint(
+            sort=sort, topic_ids=topic_ids, language=language, q=q,
+            since=since, until=until, bookmarkOnly=bookmarkOnly,
+        )
+        key = parse_feed_cursor(cursor, sort=sort, fingerprint=fp, ranked=bool(q))
+        cols, vals = [last_pub_sql, "c.id"], [
+            p.add(key.last_pub, "timestamptz"), p.add(key.cluster_id, "int")
+        ]
+        if sort == "weight":
+            cols, vals = ["c.weight"] + cols, [p.add(key.weight, "int")] + vals
+        if q:
+            cols, vals = [rank_sql] + cols, [p.add(key.rank, "real")] + vals
+        (having if grouped else where).append(f"({', '.join(cols)}) < ({', '.join(vals)})")
+
+    order = ["last_pub DESC", "id DESC"]
+    if sort == "weight":
+        order = ["weight DESC"] + order
+    if q:
+        order = ["best_rank DESC"] + order
+
+    direction = "ASC" if order_in_cluster == "date_asc" else "DESC"
+    window = []
+    # окно since/until отбирает сами кластеры (см. apply_window_filter):
+    # одна граница — по cluster_source, обе — ещё EXISTS по (cluster_id, published_at)
+    cs_window = []
+    if since:
+        since_p = p.add(since, "timestamptz")
+        window.append(f"a.published_at >= {since_p}")
+        cs_window.append(f"cs.last_published_at >= {since_p}")
+    if until:
+        until_p = p.add(until, "timestamptz")
+        window.append(f"a.published_at <= {until_p}")
+        cs_window.append(f"cs.first_published_at <= {until_p}")
+    if since and until:
+        where.append(
+            "EXISTS (SELECT 1 FROM article a "
+            f"WHERE a.cluster_id = c.id AND a.source_id = ANY({allowed}) "
+            f"AND a.published_at >= {since_p} AND a.published_at <= {until_p})"
+        )
+
+    cs_window_sql = "".join(" AND " + w for w in cs_window)
+    cs_join_sql = group_sql = ""
+    if grouped:
+        cs_join_sql = (
+            f"JOIN cluster_source cs ON cs.cluster_id = c.id AND cs.source_id = ANY({allowed}){cs_window_sql}"
+        )
+        group_sql = "GROUP BY c.id"
+    else:
+        where.append(
+            "EXISTS (SELECT 1 FROM cluster_source cs "
+            f"WHERE cs.cluster_id = c.id AND cs.source_id = ANY({allowed}){cs_window_sql})"
+        )
+
+    where_sql = "WHERE " + " AND ".join(where) if where else ""
+    having_sql = "HAVING " + " AND ".join(having) if having else ""
+    window_sql = "".join(" AND " + w for w in window)
+
+    ctes.append(f"""picked AS (
+    SELECT c.id, c.weight, c.first_published_at,
+           {last_pub_sql} AS last_pub,
+           {rank_sql} AS best_rank
+    FROM cluster c
+    {cs_join_sql}
+    {search_join}
+    {where_sql}
+    {group_sql}
+    {having_sql}
+    ORDER BY {", ".join(order)}
+    LIMIT {p.add(limit, "int")}
+)""")
+    ctes_sql = ",\n".join(ctes)
+    # только запрошенные поля статьи (fields=/view=) — summary/image не читаются зря
+    article_cols, source_join = article_select_sql(article_fields)
+    lateral_cols = ", ".join(f"a.{f}" for f in article_fields if f != "source_domain")
+
+    sql = f"""
+WITH {ctes_sql}
+SELECT
+    p.id AS cluster_id, p.weight, p.last_pub, p.first_published_at, p.best_rank,
+    COALESCE(st.bookmarked, false) AS bookmarked, COALESCE(st.read, false) AS read,
+    {article_cols},
+    CASE WHEN {uid} IS NOT NULL THEN COALESCE(us.rank, {p.add(DEFAULT_RANK, 'int')}) END AS source_rank
+FROM picked p
+LEFT JOIN LATERAL (
+    SELECT {lateral_cols}
+    FROM article a
+    WHERE a.cluster_id = p.id AND a.source_id = ANY({allowed})
+    {window_sql}
+    ORDER BY a.published_at {direction}, a.id {direction}
+    LIMIT {p.add(max_articles_per_cluster, "int")}
+) a ON true
+{source_join}
+LEFT JOIN userarticlestate st ON st.cluster_id = p.id AND st.user_id = {uid}
+LEFT JOIN usersource us ON us.source_id = a.source_id AND us.user_id = {uid}
+ORDER BY {", ".join("p." + o for o in order)}, a.published_at {direction}, a.id {direction}
+"""
+    return sql, p.values
+
+
+async def fetch_feed_page(allowed_source_ids: List[int], **params) -> List[Record]:
+    """Страница одним запросом; строки разбирает feed_page_from_records."""
+    sql, values = build_feed_page_sql(allowed_source_ids, **params)
+    async with connections.get("default").acquire_connection() as conn:
+        return await conn.fetch(sql, *values)
+
+
+def page_fingerprint(sort: Literal["recent", "weight"], params: dict) -> bytes:
+    """Отпечаток фильтров страницы для курсора (см. utils.cursor.feed_fingerprint)."""
+    return feed_fingerprint(
+        sort=sort,
+        topic_ids=params.get("topic_ids"),
+        language=params.get("language"),
+        q=params.get("q"),
+        since=params.get("since"),
+        until=params.get("until"),
+        bookmarkOnly=params.get("bookmarkOnly", False),
+    )
+
+
+def _cursor_after(r: Record, sort: Literal["recent", "weight"], fingerprint: bytes, ranked: bool) -> str:
+    return make_feed_cursor(
+        sort=sort,
+        fingerprint=fingerprint,
+        rank=r["best_rank"] if ranked else None,
+        weight=r["weight"],
+        last_pub=r["last_pub"] or r["first_published_at"],
+        cid=r["cluster_id"],
+    )
+
+
+def feed_page_from_records(
+    records: List[Record],
+    *,
+    sort: Literal["recent", "weight"],
+    fingerprint: bytes,
+    ranked: bool,
+    article_fields: Sequence[str] = ARTICLE_FIELDS,
+) -> Tuple[dict, Dict[int, dict], Dict[int, int]]:
+    """
+    Раскладывает строки fetch_feed_page на общую часть страницы (как у load_feed_page),
+    флаги кластеров и ранги источников пользователя.
+    """
+    clusters: Dict[int, dict] = {}
+    flags: Dict[int, dict] = {}
+    ranks: Dict[int, int] = {}
+    last = None
+
+    for r in records:
+        cid = r["cluster_id"]
+        if cid not in clusters:
+            clusters[cid] = {"cluster_id": cid, "articles": []}
+            flags[cid] = {"bookmarked": r["bookmarked"], "read": r["read"]}
+            last = r
+        if r["article_id"] is None:
+            continue
+        clusters[cid]["articles"].append(article_from_row(r, article_fields))
+        if r["source_rank"] is not None:
+            ranks[r["source_id"]] = r["source_rank"]
+
+    if last is None:
+        return {"clusters": [], "next_cursor": None}, {}, {}
+
+    next_cursor = _cursor_after(last, sort, fingerprint, ranked)
+    page = {
+        "clusters": [c for c in clusters.values() if c["articles"]],
+        "next_cursor": next_cursor,
+    }
+    return page, flags, ranks
+
+
+async def select_feed_page(
+    allowed_source_ids: List[int],
+    *,
+    user: Optional[User],
+    sort: Literal["recent", "weight"],
+    search_hits: Optional[SearchHits] = None,
+    **params,
+) -> Tuple[dict, Optional[Dict[int, dict]], Optional[Dict[int, int]]]:
+    """
+    Общая часть страницы движком из settings.feed.engine.
+    Флаги и ранги приходят только от sql-движка (одним запросом), иначе — None.
+    Кэш поиска (search_hits) понимает только sql-движок, orm ищет сам.
+    """
+    if settings.feed.engine == "sql":
+        records = await fetch_feed_page(
+            allowed_source_ids, user=user, sort=sort, search_hits=search_hits, **params
+        )
+        return feed_page_from_records(
+            records,
+            sort=sort,
+            fingerprint=page_fingerprint(sort, params),
+            ranked=bool(params.get("q")),
+            article_fields=params.get("article_fields", ARTICLE_FIELDS),
+        )
+    page = await load_feed_page(allowed_source_ids, user=user, sort=sort, **params)
+    return page, None, None
+
+
+async def stream_feed_clusters(
+    allowed_source_ids: List[int],
+    *,
+    sort: Literal["recent", "weight"],
+    **params,
+) -> AsyncIterator[Tuple[Optional[dict], str]]:
+    """
+    Тот же запрос, что у fetch_feed_page, но через серверный курсор на одном соединении:
+    кластер отдаётся, как только пришли все его строки. Выдаёт (элемент ленты или None,
+    если в окне нет статей; курсор после этого кластера).
+    """
+    sql, values = build_feed_page_sql(allowed_source_ids, sort=sort, **params)
+    fingerprint, ranked = page_fingerprint(sort, params), bool(params.get("q"))
+    fields = params.get("article_fields", ARTICLE_FIELDS)
+
+    def entry(first: Record, articles: List[dict], ranks: Dict[int, int]):
+        item = None
+        if articles:
+            cluster = {"cluster_id": first["cluster_id"], "articles": articles}
+            flags = {first["cluster_id"]: {"bookmarked": first["bookmarked"], "read": first["read"]}}
+            item = build_feed_items([cluster], flags, ranks)[0]
+        return item, _cursor_after(first, sort, fingerprint, ranked)
+
+    async with connections.get("default").acquire_connection() as conn:
+        async with conn.transaction():
+            first, articles, ranks = None, [], {}
+            async for r in conn.cursor(sql, *values):
+                if first is not None and r["cluster_id"] != first["cluster_id"]:
+                    yield entry(first, articles, ranks)
+                    first, articles, ranks = None, [], {}
+                if first is None:
+                    first = r
+                if r["article_id"] is None:
+                    continue
+                articles.append(article_from_row(r, fields))
+                if r["source_rank"] is not None:
+                    ranks[r["source_id"]] = r["source_rank"]
+            if first is not None:
+                yield entry(first, articles, ranks)
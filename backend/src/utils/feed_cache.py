@@ -0,0 +1,44 @@
+import contextlib
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Optional
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from settings import settings
+
+PAGE_PREFIX = "feed:page:"
+
+
+def feed_cache_key(generations: Dict[int, int], **params) -> str:
+    """
+    Отпечаток страницы ленты: разрешённые источники с их feed_generation + параметры запроса.
+    Новая статья в любом источнике меняет его поколение, а значит и ключ —
+    старые записи просто доживают свой TTL.
+    """
+    payload = {
+        "sources": sorted(generations.items()),
+        **{k: v.isoformat() if isinstance(v, datetime) else v for k, v in params.items()},
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return PAGE_PREFIX + hashlib.sha1(raw.encode()).hexdigest()
+
+
+async def get_cached_page(redis: Redis, key: str) -> Optional[dict]:
+    try:
+        raw = await redis.get(key)
+    except RedisError:
+        return None
+    return orjson.loads(raw) if raw else None
+
+
+async def set_cached_page(redis: Redis, key: str, page: dict, ttl: Optional[int] = None) -> None:
+    with contextlib.suppress(RedisError):
+        await redis.set(
+            key,
+            orjson.dumps(page),
+            ex=ttl or settings.feed.cache_ttl_sec,
+        )
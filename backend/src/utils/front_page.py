@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+from typing import Dict, Literal, Optional, Tuple
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from utils.feed import select_feed_page
+from utils.news import resolve_allowed_sources, build_feed_items
+from utils.telemetry import WEIGHT_GENERATION_KEY
+
+Sort = Literal["recent", "weight"]
+
+
+class FrontPageSnapshot:
+    """
+    Первые K страниц анонимной ленты (источники по умолчанию) для каждой сортировки,
+    заранее сериализованные в JSON и лежащие в Redis.
+    Фоновая задача пересобирает сортировку, когда меняется её отметка: feed_generation
+    источников по умолчанию, а для sort=weight ещё и поколение весов из телеметрии.
+    """
+    SORTS = ("recent", "weight")
+    PREFIX = "feed:front:"
+
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        pages: int,
+        limit: int,
+        max_articles_per_cluster: int,
+        interval: float,
+    ):
+        self._redis = redis
+        self._pages = pages
+        self._limit = limit
+        self._max_articles = max_articles_per_cluster
+        self._interval = interval
+        self._task: asyncio.Task | None = None
+
+    def matches(self, *, limit: int, max_articles_per_cluster: int, order_in_cluster: str) -> bool:
+        """Запрос той же формы, что и снимок (фильтры проверяет вызывающий)."""
+        return (
+            limit == self._limit
+            and max_articles_per_cluster == self._max_articles
+            and order_in_cluster == "date_desc"
+        )
+
+    def _stamp_key(self, sort: Sort) -> str:
+        return f"{self.PREFIX}stamp:{sort}"
+
+    def _key(self, sort: Sort, cursor: Optional[str]) -> str:
+        return f"{self.PREFIX}{sort}:{cursor or ''}"
+
+    async def get(self, sort: Sort, cursor: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """(blob, отметка снимка сортировки) — отметка идёт в ETag."""
+        try:
+            blob, stamp = await self._redis.mget(self._key(sort, cursor), self._stamp_key(sort))
+        except RedisError:
+            return None, None
+        return blob, stamp
+
+    def _stamps(self, generations: Dict[int, int], weight_generation: Optional[str]) -> Dict[str, str]:
+        shape = [sorted(generations.items()), self._pages, self._limit, self._max_articles]
+        stamps = {}
+        for sort in self.SORTS:
+            raw = json.dumps(
+                shape + ([weight_generation or "0"] if sort == "weight" else []),
+                separators=(",", ":"),
+            )
+            stamps[sort] = hashlib.sha1(raw.encode()).hexdigest()
+        return stamps
+
+    async def refresh(self, force: bool = False) -> bool:
+        """
+        Пересобирает сортировки, у которых сменилась отметка.
+        Отметки общие в Redis, так что воркеры не делают одну работу дважды.
+        """
+        generations = await resolve_allowed_sources(None)
+        weight_generation, *current = await self._redis.mget(
+            WEIGHT_GENERATION_KEY, *(self._stamp_key(sort) for sort in self.SORTS)
+        )
+        stamps = self._stamps(generations, weight_generation)
+        stale = [
+            sort for sort, old in zip(self.SORTS, current)
+            if force or old != stamps[sort]
+        ]
+        if not stale:
+            return False
+
+        ttl = max(60, int(self._interval * 10))
+        blobs = {}
+        for sort in stale:
+            cursor = None
+            for _ in range(self._pages):
+                page = {"clusters": [], "next_cursor": None}
+                if generations:
+                    page, _, _ = await select_feed_page(
+                        list(generations),
+                        user=None,
+                        topic_ids=None,
+                        language=None,
+                        q=None,
+                        since=None,
+                        until=None,
+                        max_articles_per_cluster=self._max_articles,
+                        order_in_cluster="date_desc",
+                        bookmarkOnly=False,
+                        sort=sort,
+                        limit=self._limit,
+                        cursor=cursor,
+                    )
+                body = {"items": build_feed_items(page["clusters"], {}, {}), "next_cursor": page["next_cursor"]}
+                blobs[self._key(sort, cursor)] = orjson.dumps(body)
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for key, blob in blobs.items():
+                pipe.set(key, blob, ex=ttl)
+            for sort in stale:
+                pipe.set(self._stamp_key(sort), stamps[sort], ex=ttl)
+            await pipe.execute()
+        return True
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            while True:
+                with contextlib.suppress(Exception):
+                    await self.refresh()
+                await asyncio.sleep(self._interval)
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
@@ -0,0 +1,287 @@
+"""
+Горячее окно ленты в памяти процесса: кластеры за последние N часов в массивах
+(id, последняя публикация, битсет источников, язык). Выбор кластеров страницы —
+пересечение битсета разрешённых источников с индексом, Postgres только догружает статьи.
+Отвечает на sort=recent без q/topic_ids/bookmarkOnly/until; остальное — обычный движок.
+"""
+import asyncio
+import contextlib
+import heapq
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tortoise import connections
+
+from utils.cursor import _to_micros, _from_micros, make_feed_cursor, parse_feed_cursor
+from utils.enums import Language
+from utils.news import fetch_articles_for_clusters
+from utils.notify import ArticleNotifier
+
+HOT_CLUSTERS_SQL = """
+SELECT cs.cluster_id, cs.source_id, cs.last_published_at, c.language
+FROM cluster_source cs
+JOIN cluster c ON c.id = cs.cluster_id
+WHERE cs.cluster_id IN (
+    SELECT cluster_id FROM cluster_source WHERE last_published_at >= $1
+)
+"""
+
+CLUSTERS_BY_ID_SQL = """
+SELECT cs.cluster_id, cs.source_id, cs.last_published_at, c.language
+FROM cluster_source cs
+JOIN cluster c ON c.id = cs.cluster_id
+WHERE cs.cluster_id = ANY($1::int[])
+"""
+
+
+def source_mask(source_ids: Iterable[int]) -> int:
+    """Битсет источников: бит source_id."""
+    mask = 0
+    for sid in source_ids:
+        mask |= 1 << sid
+    return mask
+
+
+class HotFeedIndex:
+    """
+    Индекс держится в актуальном состоянии событиями ArticleNotifier (пачками раз в batch_sec)
+    и полностью перечитывается раз в reload_sec — заодно выпадают кластеры старше окна.
+    """
+
+    def __init__(
+        self,
+        notifier: ArticleNotifier,
+        *,
+        window_hours: int,
+        reload_sec: float,
+        batch_sec: float = 1.0,
+    ):
+        self._notifier = notifier
+        self._window_us = window_hours * 3600 * 1_000_000
+        self._reload_sec = reload_sec
+        self._batch_sec = batch_sec
+        self._task: asyncio.Task | None = None
+        self.ready = False
+
+        # слот -> данные кластера (параллельные массивы)
+        self._slot: Dict[int, int] = {}
+        self._ids = array("q")
+        self._max_pub = array("q")
+        self._masks: List[int] = []
+        self._langs: List[str] = []
+        self._src_pub: List[Dict[int, int]] = []
+        # слоты по (max_pub, id) по убыванию
+        self._order: List[int] = []
+
+    # --- загрузка ---
+
+    def _horizon(self) -> int:
+        return int(time.time() * 1_000_000) - self._window_us
+
+    def _put(self, rows: List[dict]) -> None:
+        per_cluster: Dict[int, Tuple[str, Dict[int, int]]] = {}
+        for r in rows:
+            lang, pubs = per_cluster.setdefault(r["cluster_id"], (r["language"], {}))
+            pubs[r["source_id"]] = _to_micros(r["last_published_at"])
+
+        for cid, (lang, pubs) in per_cluster.items():
+            slot = self._slot.get(cid)
+            if slot is None:
+                slot = len(self._ids)
+                self._slot[cid] = slot
+                self._ids.append(cid)
+                self._max_pub.append(0)
+                self._masks.append(0)
+                self._langs.append("")
+                self._src_pub.append({})
+            self._max_pub[slot] = max(pubs.values())
+            self._masks[slot] = source_mask(pubs)
+            self._langs[slot] = lang
+            self._src_pub[slot] = pubs
+
+    def _rebuild_order(self) -> None:
+        horizon = self._horizon()
+        self._order = sorted(
+            (s for s in range(len(self._ids)) if self._max_pub[s] >= horizon),
+            key=lambda s: (self._max_pub[s], self._ids[s]),
+            reverse=True,
+        )
+
+    async def reload(self) -> None:
+        rows = await connections.get("default").execute_query_dict(
+            HOT_CLUSTERS_SQL, [_from_micros(self._horizon())]
+        )
+        self._slot, self._ids, self._max_pub = {}, array("q"), array("q")
+        self._masks, self._langs, self._src_pub = [], [], []
+        self._put(rows)
+        self._rebuild_order()
+        self.ready = True
+
+    async def _apply(self, cluster_ids: List[int]) -> None:
+        rows = await connections.get("default").execute_query_dict(CLUSTERS_BY_ID_SQL, [cluster_ids])
+        self._put(rows)
+        # кластер, ушедший целиком (все статьи переехали) — пустые источники
+        for cid in set(cluster_ids) - {r["cluster_id"] for r in rows}:
+            slot = self._slot.get(cid)
+            if slot is not None:
+                self._max_pub[slot] = 0
+                self._masks[slot] = 0
+                self._src_pub[slot] = {}
+        self._rebuild_order()
+
+    # --- выборка ---
+
+    @staticmethod
+    def eligible(
+        *,
+        sort: str,
+        q: Optional[str],
+        topic_ids: Optional[List[int]],
+        bookmarkOnly: bool,
+        until: Optional[datetime],
+    ) -> bool:
+        return sort == "recent" and not (q or topic_ids or bookmarkOnly or until)
+
+    def select(
+        self,
+        allowed_source_ids: List[int],
+        *,
+        language: Optional[Language],
+        since: Optional[datetime],
+        after: Optional[Tuple[int, int]],
+        limit: int,
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        [(cluster_id, last_pub_us)] в порядке ленты или None, если окна не хватило
+        и ответ без кластеров старше окна был бы неполным.
+        """
+        horizon = self._horizon()
+        if after is not None and after[0] < horizon:
+            return None
+
+        allowed = set(allowed_source_ids)
+        allowed_mask = source_mask(allowed)
+        since_us = _to_micros(since) if since else None
+        lang = str(language) if language else None
+
+        # max_pub кластера — верхняя граница его last_pub для пользователя:
+        # кластер попадает в кучу, пока его граница не ниже вершины кучи
+        out: List[Tuple[int, int]] = []
+        heap: List[Tuple[int, int]] = []
+        order, i = self._order, 0
+        while len(out) < limit:
+            while i < len(order):
+                slot = order[i]
+                if heap and (self._max_pub[slot], self._ids[slot]) < (-heap[0][0], -heap[0][1]):
+                    break
+                i += 1
+                mask = self._masks[slot] & allowed_mask
+                if not mask or (lang and self._langs[slot] != lang):
+                    continue
+                if mask == self._masks[slot]:
+                    last_pub = self._max_pub[slot]
+                else:
+                    last_pub = max(p for s, p in self._src_pub[slot].items() if s in allowed)
+                key = (last_pub, self._ids[slot])
+                if (since_us and last_pub < since_us) or (after and key >= after):
+                    continue
+                heapq.heappush(heap, (-last_pub, -self._ids[slot]))
+            if not heap:
+                break
+            neg_pub, neg_cid = heapq.heappop(heap)
+            if -neg_pub < horizon:
+                break
+            out.append((-neg_cid, -neg_pub))
+
+        return out if len(out) == limit else None
+
+    async def select_page(
+        self,
+        allowed_source_ids: List[int],
+        *,
+        fingerprint: bytes,
+        language: Optional[Language],
+        since: Optional[datetime],
+        max_articles_per_cluster: int,
+        order_in_cluster: str,
+        limit: int,
+        cursor: Optional[str],
+        article_fields: Sequence[str],
+    ) -> Optional[dict]:
+        """Страница в формате load_feed_page; None — отдать запрос обычному движку."""
+        after = None
+        if cursor:
+            key = parse_feed_cursor(cursor, sort="recent", fingerprint=fingerprint, ranked=False)
+            after = (_to_micros(key.last_pub), key.cluster_id)
+        picked = self.select(allowed_source_ids, language=language, since=since, after=after, limit=limit)
+        if not picked:
+            return None
+
+        cluster_ids = [cid for cid, _ in picked]
+        grouped = await fetch_articles_for_clusters(
+            cluster_ids=cluster_ids,
+            allowed_source_ids=allowed_source_ids,
+            since=since,
+            until=None,
+            order_in_cluster=order_in_cluster,
+            max_articles_per_cluster=max_articles_per_cluster,
+            article_fields=article_fields,
+        )
+        last_cid, last_pub = picked[-1]
+        return {
+            "clusters": [
+                {"cluster_id": cid, "articles": grouped[cid]}
+                for cid in cluster_ids if grouped.get(cid)
+            ],
+            "next_cursor": make_feed_cursor(
+                sort="recent", fingerprint=fingerprint, rank=None,
+                weight=0, last_pub=_from_micros(last_pub), cid=last_cid,
+            ),
+        }
+
+    # --- фоновые задачи ---
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            queue = None
+            next_reload = 0.0
+            while True:
+                try:
+                    if queue is None or not self._notifier.is_registered(queue):
+                        # очередь переполнилась и отключена — события потеряны, читаем заново
+                        queue = self._notifier.register(None, max_queue=10_000)
+                        next_reload = 0.0
+                    if time.monotonic() >= next_reload:
+                        await self.reload()
+                        next_reload = time.monotonic() + self._reload_sec
+
+                    await asyncio.sleep(self._batch_sec)
+                    changed = set()
+                    while not queue.empty():
+                        event = queue.get_nowait()
+                        changed.add(event["cluster_id"])
+                        # статья переехала: у покинутого кластера мог пропасть источник
+                        if event.get("prev_cluster_id"):
+                            changed.add(event["prev_cluster_id"])
+                    if changed:
+                        await self._apply(list(changed))
+                except asyncio.CancelledError:
+                    if queue is not None:
+                        self._notifier.unregister(queue)
+                    raise
+                except Exception:
+                    await asyncio.sleep(self._batch_sec)
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
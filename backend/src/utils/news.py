@@ -1,19 +1,43 @@
 from datetime import datetime, timezone
 import random
-from typing import Optional, List, Literal, Dict
+from typing import Optional, List, Literal, Dict, Tuple, Sequence
 
-from tortoise.expressions import Q, RawSQL
+from fastapi import HTTPException
+from tortoise import connections
+from tortoise.expressions import Q, RawSQL, Subquery
+from tortoise.functions import Max
 
-from orm.models import Source, User, Article, UserArticleState, UserSource
-from utils.cursor import parse_cursor_weight, parse_cursor_recent, _from_micros
-from utils.enums import Language
+from orm.models import Source, User, UserArticleState, Cluster, Article
+from utils.cursor import feed_fingerprint, make_feed_cursor, parse_feed_cursor
+from utils.enums import Language, SourceStatus
+from utils.user_context import UserContext
 
 
-async def resolve_allowed_source_ids(user: Optional[User]) -> List[int]:
-    if user is not None:
-        return list(await user.source_ids())
-    rows = await Source.filter(is_default=True).values_list("id", flat=True)
-    return list(rows)
+async def resolve_allowed_sources(ctx: Optional[UserContext]) -> Dict[int, int]:
+    """
+    Разрешённые источники: source_id -> feed_generation (для ключа кэша ленты).
+    Подключения пользователя берём из контекста, из БД — только поколения (по PK).
+    """
+    if ctx is not None:
+        if not ctx.source_ids:
+            return {}
+        rows = await Source.filter(
+            id__in=ctx.source_ids,
+            status=SourceStatus.ACTIVE
+        ).values_list("id", "feed_generation")
+    else:
+        rows = await Source.filter(is_default=True).values_list("id", "feed_generation")
+    return {sid: gen for sid, gen in rows}
+
+
+# конфигурации полнотекстового поиска: по одной на Language и simple для остальных
+# (то же сопоставление, что у функции search_config в БД)
+SEARCH_CONFIGS = tuple(lang.value for lang in Language) + ("simple",)
+
+
+def search_configs(language: Optional[Language]) -> Tuple[str, ...]:
+    """Языки документов, которые смотрит поиск: язык запроса или все, каждый своим индексом."""
+    return (Language(language).value,) if language else SEARCH_CONFIGS
 
 
 def apply_cluster_filters(
@@ -31,48 +55,131 @@ def apply_cluster_filters(
     if language:
         qs = qs.filter(language=language)
     if q:
-        language = language or "simple"
         q_lit = q.replace("'", "''")
-        tsq = (
-            "(SELECT ("
-            "  CASE WHEN cardinality(arr)=0 THEN '' "
-            "       WHEN cardinality(arr)=1 THEN arr[1] || ':*' "
-            "       ELSE array_to_string(arr[1:cardinality(arr)-1] || (arr[cardinality(arr)] || ':*'), ' & ') "
-            "  END"
-            ")::tsquery "
-            f" FROM (SELECT regexp_split_to_array(plainto_tsquery('{language}'::regconfig, '{q_lit}')::text, ' & ') AS arr) _)"
+        tsq = {
+            cfg: (
+                "(SELECT ("
+                "  CASE WHEN cardinality(arr)=0 THEN '' "
+                "       WHEN cardinality(arr)=1 THEN arr[1] || ':*' "
+                "       ELSE array_to_string(arr[1:cardinality(arr)-1] || (arr[cardinality(arr)] || ':*'), ' & ') "
+                "  END"
+                ")::tsquery "
+                f" FROM (SELECT regexp_split_to_array(plainto_tsquery('{cfg}'::regconfig, '{q_lit}')::text, ' & ') AS arr) _)"
+            )
+            for cfg in search_configs(language)
+        }
+        # совпадение — @@ по частичному GIN-индексу cluster_search своего языка
+        hit_sql = (
+            '"cluster".id IN (SELECT cse.cluster_id FROM "cluster_search" cse WHERE '
+            + " OR ".join(f"(cse.language = '{cfg}' AND cse.document @@ {t})" for cfg, t in tsq.items())
+            + ')'
         )
+        rank_tsq = "CASE cse.language " + " ".join(f"WHEN '{cfg}' THEN {t}" for cfg, t in tsq.items()) + " END"
         best_rank_sql = (
             "COALESCE(("
-            '  SELECT MAX(ts_rank_cd(a.search_tsv, ' + tsq + '))'
-            '  FROM "article" a'
-            '  WHERE a.cluster_id = "cluster".id'
-            '    AND a.search_tsv @@ ' + tsq +
+            '  SELECT ts_rank_cd(cse.document, ' + rank_tsq + ')'
+            '  FROM "cluster_search" cse'
+            '  WHERE cse.cluster_id = "cluster".id'
             "), 0.0)"
         )
 
         qs = qs.annotate(
-            best_rank=RawSQL(best_rank_sql)
-        ).filter(best_rank__gt=0)
+            search_hit=RawSQL(hit_sql),
+            best_rank=RawSQL(best_rank_sql),
+        ).filter(search_hit=True)
     return qs
 
 
-def apply_keyset_cursor(qs, *, sort: Literal["recent", "weight"], cursor: Optional[str]):
+def apply_keyset_cursor(
+    qs, *,
+    sort: Literal["recent", "weight"],
+    cursor: Optional[str],
+    fingerprint: bytes,
+    ranked: bool,
+):
     if not cursor:
         return qs
+    key = parse_feed_cursor(cursor, sort=sort, fingerprint=fingerprint, ranked=ranked)
     if sort == "weight":
-        w, us, cid = parse_cursor_weight(cursor)
-        cdt = _from_micros(us)
-        return qs.filter(
-            Q(weight__lt=w) |
-            (Q(weight=w) & (Q(last_pub__lt=cdt) | Q(last_pub=cdt, id__lt=cid)))
-        )
-    us, cid = parse_cursor_recent(cursor)
-    cdt = _from_micros(us)
-    return qs.filter(
-        Q(last_pub__lt=cdt) |
-        Q(last_pub=cdt, id__lt=cid)
-    )
+        fields = [("weight", key.weight), ("last_published_at", key.last_pub), ("id", key.cluster_id)]
+    else:
+        fields = [("last_pub", key.last_pub), ("id", key.cluster_id)]
+    if ranked:
+        fields = [("best_rank", key.rank)] + fields
+
+    # (k1, k2, ...) < (v1, v2, ...) по убыванию всех ключей
+    cond, equal = None, {}
+    for name, value in fields:
+        step = Q(**equal, **{f"{name}__lt": value})
+        cond = step if cond is None else cond | step
+        equal[name] = value
+    return qs.filter(cond)
+
+
+# Поля статьи в ленте. id/source_id/title/published_at нужны всегда (выбор главной статьи),
+# остальные можно не запрашивать — тогда их нет ни в SELECT, ни в ответе.
+ARTICLE_FIELDS = ("id", "source_id", "source_domain", "url", "title", "summary", "published_at", "image")
+REQUIRED_ARTICLE_FIELDS = ("id", "source_id", "title", "published_at")
+COMPACT_ARTICLE_FIELDS = REQUIRED_ARTICLE_FIELDS + ("source_domain", "url")
+
+
+def resolve_article_fields(fields: Optional[str], view: Literal["full", "compact"]) -> Tuple[str, ...]:
+    """fields=title,url,... поверх view; порядок — как в ARTICLE_FIELDS."""
+    if fields:
+        wanted = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = wanted - set(ARTICLE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(sorted(unknown))}")
+    else:
+        wanted = set(COMPACT_ARTICLE_FIELDS if view == "compact" else ARTICLE_FIELDS)
+    wanted |= set(REQUIRED_ARTICLE_FIELDS)
+    return tuple(f for f in ARTICLE_FIELDS if f in wanted)
+
+
+def article_select_sql(fields: Sequence[str], alias: str = "a") -> Tuple[str, str]:
+    """(список колонок статьи, JOIN source — только если нужен source_domain)."""
+    cols = []
+    for f in fields:
+        if f == "source_domain":
+            cols.append("s.domain AS source_domain")
+        elif f == "id":
+            cols.append(f"{alias}.id AS article_id")
+        else:
+            cols.append(f"{alias}.{f}")
+    join = f"LEFT JOIN source s ON s.id = {alias}.source_id" if "source_domain" in fields else ""
+    return ", ".join(cols), join
+
+
+def article_from_row(r, fields: Sequence[str]) -> dict:
+    out = {}
+    for f in fields:
+        if f == "id":
+            out["id"] = r["article_id"]
+        elif f == "published_at":
+            out["published_at"] = r["published_at"].isoformat() if r["published_at"] else None
+        else:
+            out[f] = r[f]
+    return out
+
+
+# Не больше N статей на кластер прямо из БД: LATERAL + LIMIT идёт по индексу
+# (cluster_id, published_at) и не трогает хвост больших кластеров.
+ARTICLES_FOR_CLUSTERS_SQL = """
+SELECT a.cluster_id, {columns}
+FROM unnest($1::int[]) WITH ORDINALITY AS c(id, pos)
+CROSS JOIN LATERAL (
+    SELECT *
+    FROM article a
+    WHERE a.cluster_id = c.id
+      AND a.source_id = ANY($2::int[])
+      AND ($3::timestamptz IS NULL OR a.published_at >= $3)
+      AND ($4::timestamptz IS NULL OR a.published_at <= $4)
+    ORDER BY a.published_at {direction}, a.id {direction}
+    LIMIT $5
+) a
+{source_join}
+ORDER BY c.pos, a.published_at {direction}, a.id {direction}
+"""
 
 
 async def fetch_articles_for_clusters(
@@ -82,36 +189,19 @@ async def fetch_articles_for_clusters(
     since: Optional[datetime],
     until: Optional[datetime],
     order_in_cluster: Literal["date_desc", "date_asc"],
-    max_articles_per_cluster: int
+    max_articles_per_cluster: int,
+    article_fields: Sequence[str] = ARTICLE_FIELDS,
 ) -> Dict[int, List[dict]]:
-    qs = Article.filter(cluster_id__in=cluster_ids, source_id__in=allowed_source_ids).prefetch_related("source")
-    if since:
-        qs = qs.filter(published_at__gte=since)
-    if until:
-        qs = qs.filter(published_at__lte=until)
-
-    order_by = tuple(val for condition, val in [
-        (order_in_cluster == "date_asc", "published_at"),
-        (order_in_cluster == "date_desc", "-published_at")
-    ] if condition)
-
-    arts = await qs.order_by(*order_by)
+    direction = "ASC" if order_in_cluster == "date_asc" else "DESC"
+    columns, source_join = article_select_sql(article_fields)
+    rows = await connections.get("default").execute_query_dict(
+        ARTICLES_FOR_CLUSTERS_SQL.format(direction=direction, columns=columns, source_join=source_join),
+        [cluster_ids, allowed_source_ids, since, until, max_articles_per_cluster],
+    )
 
     grouped: Dict[int, List[dict]] = {cid: [] for cid in cluster_ids}
-    for a in arts:
-        payload = {
-            "id": a.id,
-            "source_id": a.source_id,
-            "source_domain": a.source.domain if getattr(a, "source", None) else None,
-            "url": a.url,
-            "title": a.title,
-            "summary": a.summary,
-            "published_at": a.published_at.isoformat() if a.published_at else None,
-            "image": a.image
-        }
-        lst = grouped.setdefault(a.cluster_id, [])
-        if len(lst) < max_articles_per_cluster:
-            lst.append(payload)
+    for r in rows:
+        grouped.setdefault(r["cluster_id"], []).append(article_from_row(r, article_fields))
 
     return grouped
 
@@ -128,16 +218,6 @@ async def fetch_cluster_flags(user: Optional[User], cluster_ids: List[int]) -> D
     return {r["cluster_id"]: {"bookmarked": r["bookmarked"], "read": r["read"]} for r in rows}
 
 
-async def fetch_user_source_ranks(user: Optional[User], allowed_source_ids: List[int]) -> Dict[int, int]:
-    if user is None:
-        return {}
-    rows = await UserSource.filter(
-        user_id=user.id,
-        source_id__in=allowed_source_ids
-    ).values("source_id", "rank")
-    return {r["source_id"]: r["rank"] for r in rows}
-
-
 def _parse_dt_safe(iso: Optional[str]) -> datetime:
     if not iso:
         return datetime.min.replace(tzinfo=timezone.utc)
@@ -171,3 +251,143 @@ def pick_primary(articles: List[dict], ranks: Dict[int, int], sort_by: Literal['
     else:
         candidates = articles
     return max(candidates, key=lambda x: (_parse_dt_safe(x["published_at"]), x["id"]))
+
+
+def build_feed_items(clusters: List[dict], cluster_flags: Dict[int, dict], ranks: Dict[int, int]) -> List[dict]:
+    """
+    Сборка элементов ленты (article + other_articles + флаги) из общей части страницы.
+    """
+    items = []
+    for c in clusters:
+        cid, lst = c["cluster_id"], c["articles"]
+        primary = pick_primary(lst, ranks)
+        others = [it for it in lst if it["id"] != primary["id"]]
+        flags = cluster_flags.get(cid, {})
+        items.append({
+            "cluster_id": cid,
+            "article": primary,
+            "other_articles": others,
+            "bookmarked": bool(flags.get("bookmarked", False)),
+            "read": bool(flags.get("read", False)),
+        })
+    return items
+
+
+def apply_window_filter(
+    cqs,
+    *,
+    allowed_source_ids: List[int],
+    since: Optional[datetime],
+    until: Optional[datetime],
+):
+    """
+    Окно since/until на уровне выбора кластеров, чтобы limit считал только кластеры,
+    у которых есть статья в окне. Одна граница точно проверяется по cluster_source
+    (last_published_at >= since / first_published_at <= until), при обеих — ещё
+    проверка статей кластера по индексу (cluster_id, published_at).
+    """
+    if since:
+        cqs = cqs.filter(source_index__last_published_at__gte=since)
+    if until:
+        cqs = cqs.filter(source_index__first_published_at__lte=until)
+    if since and until:
+        in_window = Article.filter(
+            source_id__in=allowed_source_ids,
+            published_at__gte=since,
+            published_at__lte=until,
+        ).values("cluster_id")
+        cqs = cqs.filter(id__in=Subquery(in_window))
+    return cqs
+
+
+async def load_feed_page(
+    allowed_source_ids: List[int],
+    *,
+    user: Optional[User],
+    topic_ids: Optional[List[int]],
+    language: Optional[Language],
+    q: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    max_articles_per_cluster: int,
+    order_in_cluster: Literal["date_desc", "date_asc"],
+    bookmarkOnly: bool,
+    sort: Literal["recent", "weight"],
+    limit: int,
+    cursor: Optional[str],
+    article_fields: Sequence[str] = ARTICLE_FIELDS,
+) -> dict:
+    """
+    Общая часть страницы ленты, не зависящая от пользователя (кроме bookmarkOnly):
+    {"clusters": [{"cluster_id", "articles"}], "next_cursor"}. Её и кэшируем.
+    """
+    # 1) Базовый запрос по кластерам + фильтры (через индекс cluster_source)
+    cqs = Cluster.filter(source_index__source_id__in=allowed_source_ids)
+    cqs = apply_cluster_filters(
+        cqs,
+        topic_ids=topic_ids,
+        language=language,
+        q=q,
+        bookmarkOnly=bookmarkOnly,
+        user=user
+    )
+    cqs = apply_window_filter(cqs, allowed_source_ids=allowed_source_ids, since=since, until=until)
+
+    # 1.1) Аннотация "последней публикации" по моим источникам
+    cqs = cqs.annotate(last_pub=Max("source_index__last_published_at"))
+
+    # 1.2) Сортировка
+    if sort == "weight":
+        # вес и последняя публикация — агрегаты строки cluster
+        order_by = ("-weight", "-last_published_at", "-id")
+    else:
+        order_by = ("-last_pub", "-id")
+    if q:
+        order_by = ("-best_rank",) + order_by
+    cqs = cqs.order_by(*order_by)
+
+    # 1.3) Курсор (keyset) — корректный для конкретной сортировки
+    fingerprint = feed_fingerprint(
+        sort=sort, topic_ids=topic_ids, language=language, q=q,
+        since=since, until=until, bookmarkOnly=bookmarkOnly,
+    )
+    cqs = apply_keyset_cursor(cqs, sort=sort, cursor=cursor, fingerprint=fingerprint, ranked=bool(q))
+    clusters = await cqs.limit(limit)
+
+    if not clusters:
+        return {"clusters": [], "next_cursor": None}
+
+    cluster_ids = [c.id for c in clusters]
+
+    # 2) Внутренние статьи кластеров (только из allowed)
+    grouped = await fetch_articles_for_clusters(
+        cluster_ids=cluster_ids,
+        allowed_source_ids=allowed_source_ids,
+        since=since,
+        until=until,
+        order_in_cluster=order_in_cluster,
+        max_articles_per_cluster=max_articles_per_cluster,
+        article_fields=article_fields,
+    )
+
+    # 3) next_cursor — по последнему кластеру
+    last = clusters[-1]
+    next_cursor = make_feed_cursor(
+        sort=sort,
+        fingerprint=fingerprint,
+        rank=getattr(last, "best_rank") if q else None,
+        weight=getattr(last, "weight") or 0,
+        last_pub=(
+            (last.last_published_at if sort == "weight" else getattr(last, "last_pub"))
+            or last.first_published_at
+        ),
+        cid=last.id,
+    )
+
+    return {
+        "clusters": [
+            {"cluster_id": cid, "articles": grouped[cid]}
+            for cid in cluster_ids if grouped.get(cid)
+        ],
+        "next_cursor": next_cursor,
+    }
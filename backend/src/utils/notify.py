@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Dict, Optional, Set
+
+import asyncpg
+
+ARTICLE_UPSERTED = "article_upserted"
+
+logger = logging.getLogger(__name__)
+
+
+class ArticleNotifier:
+    """
+    Одно LISTEN-соединение на процесс: NOTIFY из drain_cluster_refresh_queue
+    ({cluster_id, source_id, created_new, prev_cluster_id}) раздаются очередям подписчиков,
+    у которых source_id входит в их набор источников (None — все события).
+    """
+
+    def __init__(self, dsn: str, channel: str = ARTICLE_UPSERTED, reconnect_sec: float = 5.0):
+        self._dsn = dsn
+        self._channel = channel
+        self._reconnect_sec = reconnect_sec
+        self._task: asyncio.Task | None = None
+
+        # очередь подписчика -> его источники
+        self._listeners: Dict[asyncio.Queue, Optional[Set[int]]] = {}
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            while True:
+                conn = None
+                try:
+                    conn = await asyncpg.connect(self._dsn)
+                    await conn.add_listener(self._channel, self._on_notify)
+                    while not conn.is_closed():
+                        await asyncio.sleep(self._reconnect_sec)
+                except Exception:
+                    # любой сбой соединения (в т.ч. InterfaceError) — переподключаемся;
+                    # CancelledError не Exception и останавливает цикл
+                    logger.exception("article notifier connection failed, reconnecting")
+                    await asyncio.sleep(self._reconnect_sec)
+                finally:
+                    if conn is not None:
+                        with contextlib.suppress(Exception):
+                            await conn.close()
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def register(self, source_ids: Optional[Set[int]], max_queue: int = 100) -> asyncio.Queue:
+        """Регистрирует слушателя и возвращает его очередь событий."""
+        q: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._listeners[q] = source_ids
+        return q
+
+    def unregister(self, q: asyncio.Queue) -> None:
+        self._listeners.pop(q, None)
+
+    def is_registered(self, q: asyncio.Queue) -> bool:
+        return q in self._listeners
+
+    def _on_notify(self, conn, pid, channel, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        src = data.get("source_id")
+        if not isinstance(src, int):
+            return
+        for q, sources in list(self._listeners.items()):
+            if sources is not None and src not in sources:
+                continue
+            try:
+                q.put_nowait(data)
+            except asyncio.QueueFull:
+                # медленный клиент — отключаем, как и в RedisBroker
+                self._listeners.pop(q, None)
@@ -0,0 +1,158 @@
+"""
+Одноразовые коды входа в Redis: hash otp:{phone} с TTL кода, кулдаун повторной отправки
+и скользящие окна запросов по телефону и IP. Всё, что читает и меняет состояние, —
+Lua-скрипты, поэтому параллельные запросы не теряют попытки и не обходят лимиты.
+"""
+import time
+import uuid
+from typing import Dict, Tuple
+
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+
+from settings import settings
+
+OTP_PREFIX = "otp:"
+COOLDOWN_PREFIX = "otp:cd:"
+WINDOW_PREFIX = "otp:rl:"
+
+# Окна — zset'ы KEYS[first..]; лимит окна KEYS[i] — ARGV[i + shift].
+# windows_wait — мс до освобождения слота во всех окнах (0 — можно), windows_hit — учесть запрос.
+WINDOWS_LUA = """
+local function windows_wait(first, shift, now, window)
+  local wait = 0
+  for i = first, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+    if redis.call('ZCARD', KEYS[i]) >= tonumber(ARGV[i + shift]) then
+      local oldest = redis.call('ZRANGE', KEYS[i], 0, 0, 'WITHSCORES')
+      wait = math.max(wait, tonumber(oldest[2]) + window - now)
+    end
+  end
+  return wait
+end
+
+local function windows_hit(first, member, now, window)
+  for i = first, #KEYS do
+    redis.call('ZADD', KEYS[i], now, member)
+    redis.call('PEXPIRE', KEYS[i], window)
+  end
+end
+"""
+
+# KEYS — окна; ARGV: now_ms, window_ms, member, затем лимит для каждого ключа.
+# Если хоть одно окно заполнено — ничего не пишем и возвращаем мс до освобождения слота.
+SLIDING_WINDOW_LUA = WINDOWS_LUA + """
+local now, window = tonumber(ARGV[1]), tonumber(ARGV[2])
+local wait = windows_wait(1, 3, now, window)
+if wait > 0 then
+  return wait
+end
+windows_hit(1, ARGV[3], now, window)
+return 0
+"""
+
+# KEYS: otp, cooldown, затем окна; ARGV: code_hash, ttl_sec, resend_ms, now_ms, window_ms, member,
+# затем лимит для каждого окна. Возвращает {статус, мс ожидания}. Окна учитывают только
+# выданные коды: запрос, упёршийся в кулдаун или лимит, слот не занимает.
+ISSUE_LUA = WINDOWS_LUA + """
+local left = redis.call('PTTL', KEYS[2])
+if left > 0 then
+  return {1, left}
+end
+local now, window = tonumber(ARGV[4]), tonumber(ARGV[5])
+local wait = windows_wait(3, 4, now, window)
+if wait > 0 then
+  return {2, wait}
+end
+windows_hit(3, ARGV[6], now, window)
+redis.call('SET', KEYS[2], '1', 'PX', ARGV[3])
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {0, 0}
+"""
+
+# KEYS: otp; ARGV: code_hash, max_attempts.
+# 1 — код верный (удалён), 0 — кода нет или истёк, -1 — попытки кончились (удалён), -2 — неверный код.
+CHECK_LUA = """
+local otp = redis.call('HMGET', KEYS[1], 'code', 'attempts')
+if not otp[1] then
+  return 0
+end
+if tonumber(otp[2]) >= tonumber(ARGV[2]) then
+  redis.call('DEL', KEYS[1])
+  return -1
+end
+if otp[1] == ARGV[1] then
+  redis.call('DEL', KEYS[1])
+  return 1
+end
+redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+return -2
+"""
+
+OTP_OK = 1
+OTP_MISSING = 0
+OTP_EXHAUSTED = -1
+OTP_INVALID = -2
+
+ISSUE_OK = 0
+ISSUE_COOLDOWN = 1
+ISSUE_RATE_LIMITED = 2
+
+# sha считается один раз при импорте; клиент передаётся при вызове (EVALSHA, при NOSCRIPT — загрузка)
+_sliding_window = AsyncScript(None, SLIDING_WINDOW_LUA.encode())
+_issue = AsyncScript(None, ISSUE_LUA.encode())
+_check = AsyncScript(None, CHECK_LUA.encode())
+
+
+def client_ip(request: Request) -> str:
+    # за nginx: последний адрес X-Forwarded-For дописывает сам прокси
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def hit_windows(r: Redis, limits: Dict[str, int], *, window_sec: int) -> float:
+    """
+    Учитывает запрос во всех окнах ({ключ: лимит}) сразу;
+    > 0 — сколько секунд ждать, запрос не учтён ни в одном окне.
+    """
+    wait_ms = await _sliding_window(
+        keys=[WINDOW_PREFIX + k for k in limits],
+        args=[int(time.time() * 1000), window_sec * 1000, uuid.uuid4().hex, *limits.values()],
+        client=r,
+    )
+    return int(wait_ms) / 1000
+
+
+async def issue_code(
+    r: Redis, phone: str, code_hash: str, *, limits: Dict[str, int], window_sec: int
+) -> Tuple[int, float]:
+    """
+    Сохраняет код, если не идёт кулдаун и не заполнено ни одно окно ({ключ: лимит});
+    (ISSUE_*, секунды ожидания). Проверки и учёт в окнах — одним скриптом.
+    """
+    status, wait_ms = await _issue(
+        keys=[OTP_PREFIX + phone, COOLDOWN_PREFIX + phone, *(WINDOW_PREFIX + k for k in limits)],
+        args=[
+            code_hash, settings.otp.ttl_min * 60, settings.otp.resend_sec * 1000,
+            int(time.time() * 1000), window_sec * 1000, uuid.uuid4().hex, *limits.values(),
+        ],
+        client=r,
+    )
+    return int(status), int(wait_ms) / 1000
+
+
+async def check_code(r: Redis, phone: str, code_hash: str) -> int:
+    return int(await _check(
+        keys=[OTP_PREFIX + phone],
+        args=[code_hash, settings.otp.max_attempts],
+        client=r,
+    ))
+
+
+def retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, int(seconds + 0.999)))}
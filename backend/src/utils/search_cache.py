@@ -0,0 +1,119 @@
+"""
+Кэш результатов поиска: ранжированный список кластеров на
+(нормализованный запрос, язык, корзина времени) в Redis.
+Лента пересекает его с источниками пользователя и курсором уже в SQL (search_hits в utils/feed.py).
+"""
+import contextlib
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from tortoise import connections
+
+from settings import settings
+from utils.enums import Language
+from utils.feed import SearchHits, _Params, search_tsq_cte, search_match_sql
+from utils.news import search_configs
+
+HITS_PREFIX = "search:hits:"
+
+# нормализация теми же правилами лексера, что и у поиска + отметка ингеста
+NORMALIZE_SQL = """
+SELECT cfg, plainto_tsquery(cfg::regconfig, $1)::text AS norm,
+       (SELECT last_value FROM article_id_seq) AS ingest
+FROM unnest($2::text[]) AS cfg
+"""
+
+
+async def normalize_query(q: str, language: Optional[Language]) -> Tuple[Dict[str, str], int]:
+    """
+    ({язык: plainto_tsquery(q)::text}, последний id статьи).
+    "Выборы ", "выборы" и "ВЫБОРЫ" дают одно и то же.
+    """
+    rows = await connections.get("default").execute_query_dict(
+        NORMALIZE_SQL, [q, list(search_configs(language))]
+    )
+    return {r["cfg"]: r["norm"] for r in rows}, rows[0]["ingest"] if rows else 0
+
+
+def search_cache_key(norm: Dict[str, str], language: Optional[Language], bucket: int) -> str:
+    raw = orjson.dumps([sorted(norm.items()), str(language or ""), bucket])
+    return HITS_PREFIX + hashlib.sha1(raw).hexdigest()
+
+
+async def fetch_search_hits(q: str, language: Optional[Language], max_hits: int) -> SearchHits:
+    """
+    Лучшие max_hits кластеров по рангу — без фильтров по источникам, окну и курсору.
+    Список режется по целому рангу: лента листает по (rank, last_published_at, id),
+    а не по id, и кластеры недобранного ранга, не вошедшие в список, при переходе
+    на поиск без кэша оказались бы позади курсора. Последний неполный ранг отбрасывается.
+    """
+    configs = search_configs(language)
+    p = _Params()
+    sql = f"""
+WITH {search_tsq_cte(p, q, configs)}
+SELECT cse.cluster_id, ts_rank_cd(cse.document, tsq.query) AS rank
+FROM cluster_search cse
+JOIN tsq ON tsq.language = cse.language
+WHERE {search_match_sql(configs)}
+ORDER BY rank DESC, cse.cluster_id DESC
+LIMIT {p.add(max_hits + 1, "int")}
+"""
+    async with connections.get("default").acquire_connection() as conn:
+        rows = await conn.fetch(sql, *p.values)
+    return cut_rank_tier([r["cluster_id"] for r in rows], [r["rank"] for r in rows], max_hits)
+
+
+def cut_rank_tier(ids: List[int], ranks: List[float], max_hits: int) -> SearchHits:
+    """ids/ranks по убыванию ранга, до max_hits + 1 штук: не больше max_hits, целыми рангами."""
+    if len(ids) <= max_hits:
+        return SearchHits(ids, ranks)
+    cut = max_hits
+    # ранг первого не вошедшего кластера обрезан — убираем его целиком
+    while cut > 0 and ranks[cut - 1] == ranks[max_hits]:
+        cut -= 1
+    return SearchHits(ids[:cut], ranks[:cut], truncated=True)
+
+
+async def get_search_hits(redis: Redis, q: str, language: Optional[Language]) -> SearchHits:
+    """
+    Ранжированные кластеры запроса. Запись живёт не дольше корзины времени и
+    устаревает раньше, если с момента сборки пришло больше search_max_new_articles статей.
+    """
+    norm, ingest = await normalize_query(q, language)
+    if not any(norm.values()):
+        # одни стоп-слова — совпадений не будет
+        return SearchHits([], [])
+
+    bucket = int(time.time() // settings.feed.search_bucket_sec)
+    key = search_cache_key(norm, language, bucket)
+    try:
+        raw = await redis.get(key)
+    except RedisError:
+        raw = None
+    if raw:
+        cached = orjson.loads(raw)
+        if ingest - cached["ingest"] < settings.feed.search_max_new_articles:
+            # записи до разметки truncated: обрезанным считался полный список
+            truncated = cached.get("truncated", len(cached["ids"]) >= settings.feed.search_max_hits)
+            return SearchHits(cached["ids"], cached["ranks"], truncated)
+
+    hits = await fetch_search_hits(q, language, settings.feed.search_max_hits)
+    with contextlib.suppress(RedisError):
+        await redis.set(
+            key,
+            orjson.dumps({"ingest": ingest, "ids": hits.ids, "ranks": hits.ranks, "truncated": hits.truncated}),
+            ex=settings.feed.search_bucket_sec,
+        )
+    return hits
+
+
+def hits_truncated(search_hits: Optional[SearchHits]) -> bool:
+    """
+    Список обрезан (search_max_hits): дальше по рангу есть совпадения, которых в нём нет.
+    Если пересечение с источниками и курсором не набрало страницу — искать без кэша.
+    """
+    return search_hits is not None and search_hits.truncated
@@ -0,0 +1,91 @@
+"""
+Подписки пользователя: общий набор источников по умолчанию (is_default, строк в usersource нет)
+плюс свои строки UserSource. Строка на источник по умолчанию появляется, только когда
+пользователь его меняет: ранг/интервал — обычная строка, отписка — строка с excluded.
+"""
+from typing import List, Optional
+
+from tortoise import connections
+
+from orm.models import Source, UserSource
+from utils.enums import SourceStatus
+
+DEFAULT_RANK = UserSource._meta.fields_map["rank"].default
+DEFAULT_POLL_INTERVAL_SEC = UserSource._meta.fields_map["poll_interval_sec"].default
+
+SUBSCRIPTIONS_SQL = """
+SELECT s.id AS source_id,
+       us.id AS user_source_id,
+       COALESCE(us.rank, $2) AS rank,
+       COALESCE(us.poll_interval_sec, $3) AS poll_interval_sec,
+       COALESCE(us.created_at, s.created_at) AS created_at
+FROM source s
+LEFT JOIN usersource us ON us.source_id = s.id AND us.user_id = $1
+WHERE (s.is_default OR us.id IS NOT NULL)
+  AND NOT COALESCE(us.excluded, FALSE)
+  {status}
+ORDER BY us.id NULLS FIRST, s.id
+"""
+
+
+def virtual_user_source_id(source_id: int) -> int:
+    """
+    id неявной подписки на источник по умолчанию в UserSourceOut: -source_id.
+    PATCH /source/update по нему материализует строку.
+    """
+    return -source_id
+
+
+async def fetch_subscriptions(user_id: int, *, active_only: bool = True) -> List[dict]:
+    """[{source_id, user_source_id (None у неявной), rank, poll_interval_sec, created_at}]"""
+    status = "AND s.status = $4" if active_only else ""
+    values = [user_id, DEFAULT_RANK, DEFAULT_POLL_INTERVAL_SEC]
+    if active_only:
+        values.append(SourceStatus.ACTIVE.value)
+    return await connections.get("default").execute_query_dict(
+        SUBSCRIPTIONS_SQL.format(status=status), values
+    )
+
+
+async def subscribe(user_id: int, source: Source) -> Optional[UserSource]:
+    """Подключает источник; None — подписка неявная (источник по умолчанию), строка не нужна."""
+    us = await UserSource.get_or_none(user_id=user_id, source_id=source.id)
+    if us is None:
+        if source.is_default:
+            return None
+        return await UserSource.create(user_id=user_id, source_id=source.id)
+    if us.excluded:
+        if source.is_default and (us.rank, us.poll_interval_sec) == (DEFAULT_RANK, DEFAULT_POLL_INTERVAL_SEC):
+            # без собственных настроек строка больше не нужна
+            await us.delete()
+            return None
+        us.excluded = False
+        await us.save(update_fields=["excluded"])
+    return us
+
+
+async def unsubscribe(user_id: int, source: Source) -> bool:
+    """False — пользователь и так не подписан."""
+    us = await UserSource.get_or_none(user_id=user_id, source_id=source.id)
+    if not source.is_default:
+        if us is None:
+            return False
+        await us.delete()
+        return True
+    if us is None:
+        await UserSource.create(user_id=user_id, source_id=source.id, excluded=True)
+        return True
+    if us.excluded:
+        return False
+    us.excluded = True
+    await us.save(update_fields=["excluded"])
+    return True
+
+
+async def materialize(user_id: int, source_id: int) -> Optional[UserSource]:
+    """Строка для неявной подписки на источник по умолчанию — перед изменением её настроек."""
+    source = await Source.get_or_none(id=source_id, is_default=True)
+    if source is None:
+        return None
+    us, _ = await UserSource.get_or_create(user_id=user_id, source_id=source_id)
+    return None if us.excluded else us
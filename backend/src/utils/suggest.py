@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import re
+from typing import List, Optional
+
+from tortoise import connections
+
+from utils.enums import Language
+
+# верхняя граница префиксного диапазона в COLLATE "C"
+_PREFIX_END = "\U0010ffff"
+# те же границы слов, что и '[^[:alnum:]]+' в refresh_search_suggest
+_WORD_SPLIT = re.compile(r"[\W_]+")
+
+SUGGEST_SQL = """
+SELECT text, cluster_id
+FROM search_suggest
+WHERE kind = $1
+  AND prefix_key >= $2 AND prefix_key < $3
+  AND ($4::text IS NULL OR language = $4)
+ORDER BY score DESC, id
+LIMIT $5
+"""
+
+
+def _prefix_args(prefix: str) -> List[str]:
+    return [prefix, prefix + _PREFIX_END]
+
+
+async def fetch_suggestions(q: str, language: Optional[Language], limit: int) -> dict:
+    """
+    Подсказки из search_suggest, без article: дополнения последнего слова запроса
+    и заголовки кластеров, начинающиеся с запроса.
+    """
+    text = " ".join(q.lower().split())
+    words = [w for w in _WORD_SPLIT.split(text) if w]
+    if not words:
+        return {"terms": [], "clusters": []}
+
+    lang = str(language) if language else None
+    async with connections.get("default").acquire_connection() as conn:
+        terms = []
+        # дополняем слово, только пока его набирают
+        if text.endswith(words[-1]):
+            head = text[: len(text) - len(words[-1])]
+            rows = await conn.fetch(SUGGEST_SQL, "term", *_prefix_args(words[-1]), lang, limit)
+            terms = [head + r["text"] for r in rows]
+        titles = await conn.fetch(SUGGEST_SQL, "title", *_prefix_args(text), lang, limit)
+    return {
+        "terms": terms,
+        "clusters": [{"cluster_id": r["cluster_id"], "title": r["text"]} for r in titles],
+    }
+
+
+class SuggestIndex:
+    """
+    Фоновая пересборка search_suggest (refresh_search_suggest в БД).
+    Работу делает один воркер — остальные упираются в advisory lock и пропускают цикл.
+    """
+
+    def __init__(self, *, days: int, min_freq: int, max_titles: int, interval: float):
+        self._days = days
+        self._min_freq = min_freq
+        self._max_titles = max_titles
+        self._interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self) -> bool:
+        rows = await connections.get("default").execute_query_dict(
+            "SELECT refresh_search_suggest($1, $2, $3) AS done",
+            [self._days, self._min_freq, self._max_titles],
+        )
+        return bool(rows and rows[0]["done"])
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            while True:
+                with contextlib.suppress(Exception):
+                    await self.refresh()
+                await asyncio.sleep(self._interval)
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
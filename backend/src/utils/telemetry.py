@@ -0,0 +1,295 @@
+"""
+Приём телеметрии пачкой: вклад событий суммируется по кластерам, свежесть считается
+один раз на кластер по first_published_at из одного запроса, веса применяются одним
+UPDATE ... FROM unnest.
+
+Запись отложенная: /telemetry/events только копит вклад в Redis по корзинам времени
+(HINCRBYFLOAT), TelemetryFlusher раз в несколько секунд переносит закрытые корзины
+в cluster.weight. Корзина удаляется после коммита в БД — at-least-once. Корзина, которую
+не удалось применить, откладывается под telemetry:dead:* и не держит остальные.
+"""
+import asyncio
+import contextlib
+import logging
+import math
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
+from tortoise import connections
+
+from schemes.telemetry import Event
+
+logger = logging.getLogger(__name__)
+
+# вклад события в вес кластера; dwell — за каждые полные 5 секунд
+EVENT_WEIGHTS = {"impression": 1.0, "click": 5.0, "outbound": 8.0}
+DWELL_STEP_SEC = 5
+# фронт считает dwell и при скрытой вкладке: дольше часа в зачёт не идёт
+MAX_DWELL_MS = 3_600_000
+# id кластеров — int4 в БД; событие с id вне диапазона пропускается, пачка принимается
+MAX_CLUSTER_ID = 2**31 - 1
+# свежесть: exp(-часы / RECENCY_HOURS) от first_published_at кластера
+RECENCY_HOURS = 48.0
+# cluster.weight — int4: прибавка за корзину ограничена, сумма в UPDATE насыщается
+MAX_WEIGHT_INC = 1_000_000
+
+FIRST_PUBLISHED_SQL = "SELECT id, first_published_at FROM cluster WHERE id = ANY($1::int[])"
+
+APPLY_WEIGHTS_SQL = """
+UPDATE cluster c
+SET weight = LEAST(GREATEST(c.weight::bigint + d.inc, -2147483648), 2147483647)
+FROM unnest($1::int[], $2::int[]) AS d(cluster_id, inc)
+WHERE c.id = d.cluster_id
+"""
+
+
+def event_delta(ev: Event) -> float:
+    if ev.type == "dwell":
+        return float(max(0, min(ev.dwell_ms or 0, MAX_DWELL_MS)) // 1000 // DWELL_STEP_SEC)
+    return EVENT_WEIGHTS.get(ev.type, 0.0)
+
+
+def sum_deltas(events: Iterable[Event]) -> Dict[int, float]:
+    """cluster_id -> сырой вклад событий (без свежести)."""
+    deltas: Dict[int, float] = {}
+    for ev in events:
+        delta = event_delta(ev)
+        if delta > 0 and 0 < ev.cluster_id <= MAX_CLUSTER_ID:
+            deltas[ev.cluster_id] = deltas.get(ev.cluster_id, 0.0) + delta
+    return deltas
+
+
+def weigh_deltas(
+    deltas: Dict[int, float],
+    first_published: Dict[int, datetime],
+    now: datetime,
+) -> Tuple[List[int], List[int]]:
+    """
+    Параллельные массивы (cluster_id, прибавка веса) для unnest, по возрастанию id —
+    одинаковый порядок блокировок строк у параллельных пачек. Нулевые прибавки отброшены,
+    остальные ограничены ±MAX_WEIGHT_INC.
+    """
+    ids, incs = [], []
+    for cid in sorted(deltas):
+        first = first_published.get(cid)
+        if first is None:
+            continue
+        if first.tzinfo is None:
+            first = first.replace(tzinfo=timezone.utc)
+        hours = max(0.0, (now - first).total_seconds() / 3600.0)
+        inc = deltas[cid] * math.exp(-hours / RECENCY_HOURS)
+        if not math.isfinite(inc):
+            continue
+        inc = int(round(max(-MAX_WEIGHT_INC, min(MAX_WEIGHT_INC, inc))))
+        if inc:
+            ids.append(cid)
+            incs.append(inc)
+    return ids, incs
+
+
+async def apply_deltas(deltas: Dict[int, float], now: Optional[datetime] = None) -> int:
+    """
+    Два запроса на пачку при любом числе событий; возвращает число обновлённых кластеров.
+    now — момент, на который считается свежесть (для корзины — её конец).
+    """
+    if not deltas:
+        return 0
+    async with connections.get("default").acquire_connection() as conn:
+        rows = await conn.fetch(FIRST_PUBLISHED_SQL, list(deltas))
+        ids, incs = weigh_deltas(
+            deltas,
+            {r["id"]: r["first_published_at"] for r in rows},
+            now or datetime.now(timezone.utc),
+        )
+        if ids:
+            await conn.execute(APPLY_WEIGHTS_SQL, ids, incs)
+    return len(ids)
+
+
+async def _db_alive() -> bool:
+    try:
+        await connections.get("default").execute_query("SELECT 1")
+    except Exception:
+        return False
+    return True
+
+
+def decode_body(body: bytes, encoding: str, *, max_bytes: int) -> bytes:
+    """
+    Тело запроса с учётом Content-Encoding (gzip/deflate). Распакованный размер
+    ограничен max_bytes — сжатая бомба не раздуется в памяти.
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        data = body
+    elif encoding in ("gzip", "x-gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS
+        decompressor = zlib.decompressobj(wbits)
+        try:
+            data = decompressor.decompress(body, max_bytes + 1)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="invalid compressed body")
+        if not decompressor.eof and len(data) <= max_bytes:
+            raise HTTPException(status_code=400, detail="invalid compressed body")
+    else:
+        raise HTTPException(status_code=415, detail="unsupported content encoding")
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail="telemetry batch too large")
+    return data
+
+
+# --- отложенная запись ---
+
+BUCKET_PREFIX = "telemetry:bucket:"
+FLUSHING_PREFIX = "telemetry:flushing:"
+# zset начал корзин, в которых что-то копится или не донесено до БД
+BUCKETS_KEY = "telemetry:buckets"
+FLUSH_LOCK_KEY = "telemetry:flush:lock"
+# корзины, которые не удалось применить: zset ключей по началу корзины, разбираются вручную
+DEAD_PREFIX = "telemetry:dead:"
+DEAD_BUCKETS_KEY = "telemetry:dead"
+# растёт после каждого переноса, изменившего веса: по нему пересобираются снимки sort=weight
+WEIGHT_GENERATION_KEY = "telemetry:weight:gen"
+
+# KEYS: корзина, её копия на переносе, BUCKETS_KEY; ARGV: начало корзины.
+# Недонесённая копия (упали до DEL) отдаётся снова, иначе корзина переименовывается:
+# поздние события попадут в новый ключ с тем же именем и уйдут следующим циклом.
+CLAIM_BUCKET_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+  if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    return {}
+  end
+  redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_claim_bucket = AsyncScript(None, CLAIM_BUCKET_LUA.encode())
+_release_lock = AsyncScript(None, RELEASE_LOCK_LUA.encode())
+
+
+async def buffer_deltas(r: Redis, deltas: Dict[int, float], *, bucket_sec: int) -> None:
+    """Вклад пачки — в текущую корзину, одной транзакцией."""
+    if not deltas:
+        return
+    start = int(time.time()) // bucket_sec * bucket_sec
+    key = f"{BUCKET_PREFIX}{start}"
+    async with r.pipeline(transaction=True) as pipe:
+        for cid, delta in deltas.items():
+            pipe.hincrbyfloat(key, cid, delta)
+        pipe.zadd(BUCKETS_KEY, {str(start): start})
+        await pipe.execute()
+
+
+async def flush_lag(r: Redis, *, bucket_sec: int) -> dict:
+    """
+    Отставание переноса: сколько секунд назад закрылась самая старая недонесённая корзина
+    (0 — всё перенесено), сколько корзин ждёт и сколько отложено как неприменимые.
+    """
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.zrange(BUCKETS_KEY, 0, 0, withscores=True)
+        pipe.zcard(BUCKETS_KEY)
+        pipe.zcard(DEAD_BUCKETS_KEY)
+        oldest, pending, dead = await pipe.execute()
+    lag = 0.0
+    if oldest:
+        lag = max(0.0, time.time() - (oldest[0][1] + bucket_sec))
+    return {"lag_sec": round(lag, 3), "pending_buckets": pending, "dead_buckets": dead}
+
+
+class TelemetryFlusher:
+    """
+    Переносит закрытые корзины в cluster.weight. Между воркерами — один перенос за раз
+    (SET NX); упавший посреди переноса цикл повторится целиком, вклад может примениться дважды.
+    """
+
+    def __init__(self, redis: Redis, *, bucket_sec: int, interval: float, lock_ttl: float = 60.0):
+        self._redis = redis
+        self._bucket_sec = bucket_sec
+        self._interval = interval
+        self._lock_ttl = lock_ttl
+        self._task: asyncio.Task | None = None
+
+    async def flush(self) -> int:
+        """Число перенесённых корзин; 0 — переносить нечего или переносит другой воркер."""
+        token = uuid.uuid4().hex
+        if not await self._redis.set(FLUSH_LOCK_KEY, token, nx=True, px=int(self._lock_ttl * 1000)):
+            return 0
+        flushed = 0
+        try:
+            closed = await self._redis.zrangebyscore(
+                BUCKETS_KEY, "-inf", int(time.time()) - self._bucket_sec
+            )
+            for start in closed:
+                flushing = f"{FLUSHING_PREFIX}{start}"
+                flat = await _claim_bucket(
+                    keys=[f"{BUCKET_PREFIX}{start}", flushing, BUCKETS_KEY], args=[start], client=self._redis
+                )
+                if not flat:
+                    continue
+                try:
+                    deltas = {int(flat[i]): float(flat[i + 1]) for i in range(0, len(flat), 2)}
+                    end = datetime.fromtimestamp(int(start) + self._bucket_sec, timezone.utc)
+                    await apply_deltas(deltas, now=end)
+                except Exception:
+                    # БД недоступна — корзина остаётся на переносе и повторится следующим циклом
+                    if not await _db_alive():
+                        raise
+                    # битая корзина не должна останавливать перенос остальных
+                    dead = await self._park(start)
+                    logger.exception("telemetry bucket %s failed to apply, moved to %s", start, dead)
+                    continue
+                # только после коммита: упали раньше — корзина перенесётся ещё раз
+                await self._redis.delete(flushing)
+                flushed += 1
+            if flushed:
+                await self._redis.incr(WEIGHT_GENERATION_KEY)
+        finally:
+            with contextlib.suppress(RedisError):
+                await _release_lock(keys=[FLUSH_LOCK_KEY], args=[token], client=self._redis)
+        return flushed
+
+    async def _park(self, start: str) -> str:
+        """Переносит корзину с переноса под telemetry:dead:*; возвращает новый ключ."""
+        # суффикс: поздние события той же корзины могут упасть ещё раз
+        dead = f"{DEAD_PREFIX}{start}:{uuid.uuid4().hex[:8]}"
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rename(f"{FLUSHING_PREFIX}{start}", dead)
+            pipe.zadd(DEAD_BUCKETS_KEY, {dead: int(start)})
+            pipe.zrem(BUCKETS_KEY, start)
+            await pipe.execute()
+        return dead
+
+    async def start(self) -> None:
+        if self._task:
+            return
+
+        async def _runner():
+            while True:
+                with contextlib.suppress(Exception):
+                    await self.flush()
+                await asyncio.sleep(self._interval)
+
+        self._task = asyncio.create_task(_runner())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
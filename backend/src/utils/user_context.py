@@ -0,0 +1,123 @@
+"""
+Контекст пользователя на запрос: строка user, активные подключённые источники и их ранги.
+Меняется только когда пользователь правит свои источники, поэтому живёт в LRU процесса
+и в Redis под номером версии. Роуты, меняющие подключения, поднимают версию (invalidate) —
+на обычный запрос ленты в БД за пользователем не ходим, в Redis — один GET версии.
+"""
+import contextlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from orm.models import User
+from utils.subscriptions import fetch_subscriptions
+
+CONTEXT_PREFIX = "ctx:user:"
+CONTEXT_VERSION_PREFIX = "ctx:user:ver:"
+
+USER_FIELDS = ("id", "phone", "phone_verified_at", "name", "avatar", "created_at")
+_DATETIME_FIELDS = ("phone_verified_at", "created_at")
+
+
+class UserContext(NamedTuple):
+    user: User
+    source_ids: Tuple[int, ...]
+    ranks: Dict[int, int]
+
+
+def _user_from_row(row: dict) -> User:
+    # новый экземпляр на каждый запрос: кэшированная модель не делится между запросами
+    row = {
+        k: datetime.fromisoformat(v) if k in _DATETIME_FIELDS and isinstance(v, str) else v
+        for k, v in row.items()
+    }
+    return User._init_from_db(**row)
+
+
+def _context_from_blob(blob: dict) -> UserContext:
+    return UserContext(
+        user=_user_from_row(blob["user"]),
+        source_ids=tuple(blob["source_ids"]),
+        ranks={int(sid): rank for sid, rank in blob["ranks"].items()},
+    )
+
+
+async def fetch_user_context_blob(user_id: int) -> Optional[dict]:
+    rows = await User.filter(id=user_id).values(*USER_FIELDS)
+    if not rows:
+        return None
+    # источники по умолчанию + свои строки без исключённых
+    links = await fetch_subscriptions(user_id)
+    return {
+        "user": rows[0],
+        "source_ids": sorted(l["source_id"] for l in links),
+        "ranks": {l["source_id"]: l["rank"] for l in links},
+    }
+
+
+class UserContextCache:
+    """
+    LRU процесса -> Redis (ctx:user:{id}:{версия}) -> БД.
+    Запись любого уровня годна, только пока совпадает версия ctx:user:ver:{id};
+    смену статуса источника без участия пользователя покрывает TTL.
+    """
+
+    def __init__(self, redis: Redis, *, ttl: int, max_size: int):
+        self._redis = redis
+        self._ttl = ttl
+        self._max_size = max_size
+        # user_id -> (истекает, версия, blob)
+        self._local: "OrderedDict[int, Tuple[float, int, dict]]" = OrderedDict()
+
+    async def get(self, user_id: int) -> Optional[UserContext]:
+        try:
+            version = int(await self._redis.get(f"{CONTEXT_VERSION_PREFIX}{user_id}") or 0)
+        except RedisError:
+            # без версии локальной записи не верим — читаем из БД
+            blob = await fetch_user_context_blob(user_id)
+            return _context_from_blob(blob) if blob else None
+
+        hit = self._local.get(user_id)
+        if hit and hit[0] > time.monotonic() and hit[1] == version:
+            self._local.move_to_end(user_id)
+            return _context_from_blob(hit[2])
+
+        key = f"{CONTEXT_PREFIX}{user_id}:{version}"
+        blob = None
+        with contextlib.suppress(RedisError):
+            raw = await self._redis.get(key)
+            blob = orjson.loads(raw) if raw else None
+        if blob is None:
+            blob = await fetch_user_context_blob(user_id)
+            if blob is None:
+                return None
+            # сериализуем сразу: в LRU и Redis лежит одно и то же
+            raw = orjson.dumps(blob, option=orjson.OPT_NON_STR_KEYS)
+            blob = orjson.loads(raw)
+            with contextlib.suppress(RedisError):
+                await self._redis.set(key, raw, ex=self._ttl)
+
+        self._remember(user_id, version, blob)
+        return _context_from_blob(blob)
+
+    def _remember(self, user_id: int, version: int, blob: dict) -> None:
+        self._local[user_id] = (time.monotonic() + self._ttl, version, blob)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self._max_size:
+            self._local.popitem(last=False)
+
+    async def invalidate(self, user_id: int) -> None:
+        """Вызывать после коммита изменений подключений/рангов пользователя."""
+        self._local.pop(user_id, None)
+        with contextlib.suppress(RedisError):
+            await self._redis.incr(f"{CONTEXT_VERSION_PREFIX}{user_id}")
+
+
+def get_user_contexts(request: Request) -> UserContextCache:
+    return request.app.state.user_context
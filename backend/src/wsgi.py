@@ -15,7 +15,15 @@ from settings import settings
 from fastapi.openapi.utils import get_openapi
 from redis.asyncio import Redis, ConnectionPool
 
+from utils.cluster_refresh import ClusterRefresher
+from utils.compression import StreamingAwareCompression
+from utils.front_page import FrontPageSnapshot
+from utils.hot_feed import HotFeedIndex
+from utils.notify import ArticleNotifier
 from utils.redis import RedisBroker
+from utils.suggest import SuggestIndex
+from utils.telemetry import TelemetryFlusher
+from utils.user_context import UserContextCache
 
 
 @asynccontextmanager
@@ -27,15 +35,63 @@ async def lifespan(app: FastAPI):
         max_connections=40
     )
     app.state.redis = Redis(connection_pool=pool)
+    app.state.user_context = UserContextCache(
+        app.state.redis,
+        ttl=settings.user_context.ttl_sec,
+        max_size=settings.user_context.max_size,
+    )
     app.state.broker = RedisBroker(
         url=settings.redis.url,
         in_channels=settings.redis.channels,
         out_channel=settings.redis.out_channel,
     )
     await app.state.broker.start()
+    app.state.front_page = FrontPageSnapshot(
+        app.state.redis,
+        pages=settings.feed.front_pages,
+        limit=settings.feed.page_limit,
+        max_articles_per_cluster=settings.feed.page_max_articles,
+        interval=settings.feed.front_refresh_sec,
+    )
+    await app.state.front_page.start()
+    app.state.notifier = ArticleNotifier(settings.db.dsn)
+    await app.state.notifier.start()
+    app.state.suggest = SuggestIndex(
+        days=settings.feed.suggest_days,
+        min_freq=settings.feed.suggest_min_freq,
+        max_titles=settings.feed.suggest_max_titles,
+        interval=settings.feed.suggest_refresh_sec,
+    )
+    await app.state.suggest.start()
+    app.state.cluster_refresh = ClusterRefresher(
+        interval=settings.feed.aggregates_refresh_sec,
+        batch=settings.feed.aggregates_batch,
+    )
+    await app.state.cluster_refresh.start()
+    app.state.telemetry = TelemetryFlusher(
+        app.state.redis,
+        bucket_sec=settings.telemetry.bucket_sec,
+        interval=settings.telemetry.flush_sec,
+    )
+    await app.state.telemetry.start()
+    app.state.hot_feed = None
+    if settings.feed.hot_enabled:
+        app.state.hot_feed = HotFeedIndex(
+            app.state.notifier,
+            window_hours=settings.feed.hot_window_hours,
+            reload_sec=settings.feed.hot_reload_sec,
+        )
+        await app.state.hot_feed.start()
     try:
         yield
     finally:
+        if app.state.hot_feed is not None:
+            await app.state.hot_feed.stop()
+        await app.state.telemetry.stop()
+        await app.state.cluster_refresh.stop()
+        await app.state.suggest.stop()
+        await app.state.notifier.stop()
+        await app.state.front_page.stop()
         await close_db()
         await app.state.redis.close()
         await app.state.broker.stop()
@@ -74,6 +130,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# br, если клиент умеет, иначе gzip — только для крупных ответов (лента, каталог);
+# SSE и NDJSON не сжимаются, иначе события застревают в буфере компрессора
+app.add_middleware(
+    StreamingAwareCompression,
+    skip_paths=("/news/events", "/news/stream"),
+    minimum_size=1024,
+    gzip_fallback=True,
+)
 app.openapi = custom_openapi
 app.include_router(auth_router)
 app.include_router(news_router)
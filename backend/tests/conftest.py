@@ -0,0 +1,15 @@
+import os
+
+# settings.py читает обязательные переменные при импорте; тестам хватает заглушек
+for name, value in {
+    "APP_SECRET": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "JWT_SECRET": "test",
+    "OTP_HASH_SALT": "test",
+    "TG_IN_CHANNEL": "tg",
+    "RSS_IN_CHANNEL": "rss",
+    "REDIS_OUT_CHANNEL": "out",
+}.items():
+    os.environ.setdefault(name, value)
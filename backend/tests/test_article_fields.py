@@ -0,0 +1,28 @@
+import pytest
+from fastapi import HTTPException
+
+from utils.news import ARTICLE_FIELDS, REQUIRED_ARTICLE_FIELDS, resolve_article_fields
+
+
+def test_full_view_by_default():
+    assert resolve_article_fields(None, "full") == ARTICLE_FIELDS
+
+
+def test_compact_view():
+    assert resolve_article_fields(None, "compact") == (
+        "id", "source_id", "source_domain", "url", "title", "published_at",
+    )
+
+
+def test_fields_keep_required_and_canonical_order():
+    fields = resolve_article_fields(" image, url ,,", "compact")
+    assert fields == ("id", "source_id", "url", "title", "published_at", "image")
+    assert set(REQUIRED_ARTICLE_FIELDS) <= set(fields)
+
+
+@pytest.mark.parametrize("fields", ["title,secret", "password", "url,summary,__class__"])
+def test_unknown_fields_rejected(fields):
+    with pytest.raises(HTTPException) as exc:
+        resolve_article_fields(fields, "full")
+    assert exc.value.status_code == 400
+    assert exc.value.detail.startswith("unknown fields: ")
@@ -0,0 +1,77 @@
+import base64
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from utils.cursor import feed_fingerprint, make_feed_cursor, parse_feed_cursor
+
+PUB = datetime(2026, 10, 17, 9, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+def fingerprint(**overrides):
+    params = dict(
+        sort="recent", topic_ids=[3, 1], language=None, q="Выборы  мэра",
+        since=None, until=None, bookmarkOnly=False,
+    )
+    params.update(overrides)
+    return feed_fingerprint(**params)
+
+
+def test_round_trip_recent():
+    fp = fingerprint()
+    cursor = make_feed_cursor(sort="recent", fingerprint=fp, rank=None, weight=0, last_pub=PUB, cid=42)
+    key = parse_feed_cursor(cursor, sort="recent", fingerprint=fp, ranked=False)
+    assert key.rank is None
+    assert key.last_pub == PUB
+    assert key.cluster_id == 42
+
+
+def test_round_trip_ranked_weight():
+    fp = fingerprint(sort="weight")
+    cursor = make_feed_cursor(sort="weight", fingerprint=fp, rank=0.25, weight=17, last_pub=PUB, cid=7)
+    key = parse_feed_cursor(cursor, sort="weight", fingerprint=fp, ranked=True)
+    assert key.rank == 0.25
+    assert key.weight == 17
+    assert (key.last_pub, key.cluster_id) == (PUB, 7)
+
+
+def test_fingerprint_normalizes_query_and_topics():
+    assert fingerprint(q="выборы мэра", topic_ids=[1, 3]) == fingerprint()
+    assert fingerprint(q="выборы") != fingerprint()
+    assert fingerprint(bookmarkOnly=True) != fingerprint()
+
+
+def _flip(cursor: str, index: int) -> str:
+    raw = bytearray(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    raw[index] ^= 0x01
+    return base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode()
+
+
+@pytest.mark.parametrize("index", [2, 12, 20, 28, -1])
+def test_tampered_cursor_rejected(index):
+    fp = fingerprint()
+    cursor = make_feed_cursor(sort="recent", fingerprint=fp, rank=None, weight=0, last_pub=PUB, cid=42)
+    with pytest.raises(HTTPException) as exc:
+        parse_feed_cursor(_flip(cursor, index), sort="recent", fingerprint=fp, ranked=False)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "AAAA", "%%%"])
+def test_garbage_cursor_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        parse_feed_cursor(cursor, sort="recent", fingerprint=fingerprint(), ranked=False)
+    assert exc.value.status_code == 400
+
+
+def test_cursor_bound_to_filters_and_sort():
+    fp = fingerprint()
+    cursor = make_feed_cursor(sort="recent", fingerprint=fp, rank=None, weight=0, last_pub=PUB, cid=42)
+    for kwargs in (
+        dict(sort="recent", fingerprint=fingerprint(q="другое"), ranked=False),
+        dict(sort="weight", fingerprint=fp, ranked=False),
+        dict(sort="recent", fingerprint=fp, ranked=True),
+    ):
+        with pytest.raises(HTTPException) as exc:
+            parse_feed_cursor(cursor, **kwargs)
+        assert exc.value.detail == "cursor does not match filters"
@@ -0,0 +1,105 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.cursor import _to_micros
+from utils.enums import Language
+from utils.hot_feed import HotFeedIndex
+
+WINDOW_HOURS = 24
+SOURCES = list(range(1, 9))
+
+
+def build_rows(seed: int, clusters: int = 200) -> list:
+    """Кластеры из 1..4 источников; часть — целиком за окном, часть с равными публикациями."""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    rows = []
+    for cid in range(1, clusters + 1):
+        lang = rnd.choice(list(Language)).value
+        for sid in rnd.sample(SOURCES, rnd.randint(1, 4)):
+            minutes = rnd.choice([rnd.randint(0, 30), rnd.randint(0, 2 * WINDOW_HOURS * 60)])
+            rows.append({
+                "cluster_id": cid,
+                "source_id": sid,
+                "last_published_at": now - timedelta(minutes=minutes),
+                "language": lang,
+            })
+    return rows
+
+
+def build_index(rows: list) -> HotFeedIndex:
+    index = HotFeedIndex(None, window_hours=WINDOW_HOURS, reload_sec=60)
+    index._put(rows)
+    index._rebuild_order()
+    return index
+
+
+def reference(rows, allowed, *, language, since, after, limit, horizon):
+    """Полный перебор: last_pub по разрешённым источникам, порядок (last_pub, id) по убыванию."""
+    last_pub, langs = {}, {}
+    for r in rows:
+        langs[r["cluster_id"]] = r["language"]
+        if r["source_id"] in allowed:
+            us = _to_micros(r["last_published_at"])
+            last_pub[r["cluster_id"]] = max(last_pub.get(r["cluster_id"], us), us)
+    keys = sorted(
+        (
+            (pub, cid) for cid, pub in last_pub.items()
+            if pub >= horizon
+            and (language is None or langs[cid] == language.value)
+            and (since is None or pub >= _to_micros(since))
+            and (after is None or (pub, cid) < after)
+        ),
+        reverse=True,
+    )[:limit]
+    if len(keys) < limit:
+        return None
+    return [(cid, pub) for pub, cid in keys]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_select_matches_keyset_pagination(seed):
+    rows = build_rows(seed)
+    index = build_index(rows)
+    horizon = index._horizon()
+    rnd = random.Random(seed)
+    for _ in range(20):
+        allowed = set(rnd.sample(SOURCES, rnd.randint(1, len(SOURCES))))
+        language = rnd.choice([None, *Language])
+        since = rnd.choice([None, datetime.now(timezone.utc) - timedelta(hours=rnd.randint(1, 12))])
+        limit = rnd.randint(1, 15)
+
+        # листаем страницами, пока индекс не откажется
+        after, pages = None, 0
+        while True:
+            got = index.select(sorted(allowed), language=language, since=since, after=after, limit=limit)
+            want = reference(rows, allowed, language=language, since=since,
+                             after=after, limit=limit, horizon=horizon)
+            assert got == want
+            if got is None:
+                break
+            cid, pub = got[-1]
+            after, pages = (pub, cid), pages + 1
+            assert pages < len(rows)
+
+
+def test_partial_mask_uses_allowed_sources_only():
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"cluster_id": 1, "source_id": 1, "last_published_at": now, "language": "ru"},
+        {"cluster_id": 1, "source_id": 2, "last_published_at": now - timedelta(hours=3), "language": "ru"},
+        {"cluster_id": 2, "source_id": 2, "last_published_at": now - timedelta(hours=1), "language": "ru"},
+    ]
+    index = build_index(rows)
+    got = index.select([2], language=None, since=None, after=None, limit=2)
+    # без источника 1 кластер 1 опускается ниже кластера 2
+    assert [cid for cid, _ in got] == [2, 1]
+    assert got[1][1] == _to_micros(now - timedelta(hours=3))
+
+
+def test_cursor_older_than_window_falls_back():
+    index = build_index(build_rows(0))
+    after = (index._horizon() - 1, 1)
+    assert index.select(SOURCES, language=None, since=None, after=after, limit=1) is None
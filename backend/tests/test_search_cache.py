@@ -0,0 +1,29 @@
+from utils.feed import SearchHits
+from utils.search_cache import cut_rank_tier, hits_truncated
+
+
+def test_short_list_kept_whole():
+    hits = cut_rank_tier([3, 2, 1], [0.9, 0.5, 0.5], 3)
+    assert hits == SearchHits([3, 2, 1], [0.9, 0.5, 0.5], False)
+    assert not hits_truncated(hits)
+
+
+def test_incomplete_last_tier_dropped():
+    hits = cut_rank_tier([5, 4, 3, 2], [0.9, 0.5, 0.5, 0.5], 3)
+    assert hits == SearchHits([5], [0.9], True)
+    assert hits_truncated(hits)
+
+
+def test_complete_tier_kept():
+    hits = cut_rank_tier([5, 4, 3, 2], [0.9, 0.5, 0.5, 0.1], 3)
+    assert hits == SearchHits([5, 4, 3], [0.9, 0.5, 0.5], True)
+
+
+def test_single_tier_beyond_limit_is_empty_but_truncated():
+    hits = cut_rank_tier([3, 2, 1], [0.5, 0.5, 0.5], 2)
+    assert hits == SearchHits([], [], True)
+    assert hits_truncated(hits)
+
+
+def test_no_hits():
+    assert not hits_truncated(None)
@@ -0,0 +1,105 @@
+import gzip
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from schemes.telemetry import Event
+from utils.telemetry import (
+    MAX_DWELL_MS, MAX_WEIGHT_INC, decode_body, sum_deltas, weigh_deltas,
+)
+
+LIMIT = 1024
+
+
+def event(type_, cluster_id=1, **kwargs):
+    return Event(session_id="s", ts=0, type=type_, cluster_id=cluster_id, **kwargs)
+
+
+# --- decode_body ---
+
+def test_identity_passthrough():
+    assert decode_body(b"{}", "", max_bytes=LIMIT) == b"{}"
+    assert decode_body(b"{}", "identity", max_bytes=LIMIT) == b"{}"
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", gzip.compress),
+    ("x-gzip", gzip.compress),
+    ("deflate", zlib.compress),
+])
+def test_compressed_round_trip(encoding, compress):
+    data = b'{"events": []}' * 10
+    assert decode_body(compress(data), encoding, max_bytes=LIMIT) == data
+
+
+def test_plain_body_over_limit():
+    with pytest.raises(HTTPException) as exc:
+        decode_body(b"x" * (LIMIT + 1), "", max_bytes=LIMIT)
+    assert exc.value.status_code == 413
+
+
+def test_compression_bomb_stops_at_limit():
+    bomb = gzip.compress(b"\0" * (LIMIT * 100))
+    assert len(bomb) < LIMIT
+    with pytest.raises(HTTPException) as exc:
+        decode_body(bomb, "gzip", max_bytes=LIMIT)
+    assert exc.value.status_code == 413
+
+
+@pytest.mark.parametrize("body", [b"not gzip", gzip.compress(b"x" * 100)[:-12]])
+def test_invalid_or_truncated_gzip(body):
+    with pytest.raises(HTTPException) as exc:
+        decode_body(body, "gzip", max_bytes=LIMIT)
+    assert exc.value.status_code == 400
+
+
+def test_unsupported_encoding():
+    with pytest.raises(HTTPException) as exc:
+        decode_body(b"", "br", max_bytes=LIMIT)
+    assert exc.value.status_code == 415
+
+
+# --- sum_deltas / weigh_deltas ---
+
+def test_sum_deltas_per_cluster():
+    deltas = sum_deltas([
+        event("impression", 1),
+        event("click", 1),
+        event("outbound", 2),
+        event("dwell", 2, dwell_ms=12_000),
+    ])
+    assert deltas == {1: 6.0, 2: 10.0}
+
+
+def test_short_dwell_contributes_nothing():
+    assert sum_deltas([event("dwell", 1, dwell_ms=4_999), event("dwell", 1)]) == {}
+
+
+def test_dwell_is_clamped_not_rejected():
+    deltas = sum_deltas([event("dwell", 1, dwell_ms=10 * MAX_DWELL_MS), event("dwell", 1, dwell_ms=-5_000)])
+    assert deltas == {1: float(MAX_DWELL_MS // 1000 // 5)}
+
+
+@pytest.mark.parametrize("cluster_id", [0, -1, 2**31])
+def test_out_of_range_cluster_ids_dropped(cluster_id):
+    assert sum_deltas([event("click", cluster_id), event("click", 5)]) == {5: 5.0}
+
+
+def test_weigh_deltas_sorted_decayed_and_clamped():
+    now = datetime(2026, 10, 17, tzinfo=timezone.utc)
+    first = {
+        3: now,
+        1: now - timedelta(hours=48),
+        2: now.replace(tzinfo=None),  # timestamp без зоны — считается UTC
+    }
+    ids, incs = weigh_deltas({3: 10.0, 1: 10.0, 2: 1e12, 4: 10.0, 5: float("inf")}, first, now)
+    assert ids == [1, 2, 3]  # 4 и 5 — нет кластера в first_published
+    assert incs == [round(10 / 2.718281828459045), MAX_WEIGHT_INC, 10]
+
+
+def test_weigh_deltas_skips_zero_and_non_finite():
+    now = datetime(2026, 10, 17, tzinfo=timezone.utc)
+    ids, incs = weigh_deltas({1: 0.2, 2: float("nan")}, {1: now, 2: now}, now)
+    assert (ids, incs) == ([], [])